@@ -0,0 +1,23 @@
+# Adding thousands of entries to one directory, the time per insert should stay flat as SYS.DR grows overflow frames
+import time
+
+from common import Disk, add
+
+def run(frame_size, count, subdirectory):
+    dsk = Disk.new("4048", frame_size)
+    directory = add(dsk, 6, "BIG.DR", "YD", None) if subdirectory else 6
+    times = []
+    lap = time.perf_counter()
+    for i in range(count):
+        add(dsk, directory, f"N{i}", "", b"")
+        if (i + 1) % 500 == 0:
+            now = time.perf_counter()
+            times.append(f"{(now - lap) / 500 * 1e6:.0f}")
+            lap = now
+    frames = len(dsk.get_directory_blocks(directory)) - len(dsk.get_index_chain(directory))
+    print(f"frame size {frame_size}, {count} entries in {'BIG.DR' if subdirectory else 'the root'} ({frames} entry blocks): us per insert, every 500: {' '.join(times)}")
+
+run(5, 4000, False)
+run(5, 4000, True)
+run(1, 3000, True)
+run(100, 4000, True)
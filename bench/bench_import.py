@@ -0,0 +1,13 @@
+# Import time of the headless modules (python3 -X importtime also works), each import runs in a fresh interpreter
+import os
+import subprocess
+import sys
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for module in ["pydgf", "pydgf.disk", "pydgf.cli"]:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start); import sys; print('gi' in sys.modules)"
+    times = []
+    for i in range(5):
+        output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+    print(f"import {module}: {min(times) * 1000:.1f} ms{' (loads gi!)' if output[1] == 'True' else ''}")
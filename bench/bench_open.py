@@ -0,0 +1,14 @@
+# Opening (byte order detection + swap) 6030 and 4048 images in both byte orders, from bytes and from a file
+import os
+import tempfile
+
+from common import Disk, make_image, little_endian, bench
+
+for dsk_type, directories in [("6030", 2), ("4048", 20)]:
+    big = bytes(make_image(dsk_type, directories, 8, 2048).disk_bytes)
+    for byteorder, image in [("big", big), ("little", little_endian(Disk(big)))]:
+        bench(f"{dsk_type} {byteorder} endian from bytes", lambda: Disk(image))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "bench.dsk")
+            with open(path, 'wb') as file: file.write(image)
+            bench(f"{dsk_type} {byteorder} endian from a file", lambda: Disk(path))
@@ -0,0 +1,19 @@
+# Full tree traversal of a filled in 4048 (decoding every directory, listing and reading every file) and raw word access
+import contextlib
+import io
+
+from common import make_image, bench
+
+from pydgf.cli import walk_dsk
+from pydgf.filecache import FileCache, resolve_data
+
+dsk = make_image("4048")
+
+def dump_tree():
+    with contextlib.redirect_stdout(io.StringIO()): dsk.dump_root_SYSDR()
+
+bench("dump_root_SYSDR", dump_tree)
+bench("walk_dsk (list)", lambda: sum(1 for entry in walk_dsk(dsk)))
+bench("walk_dsk (read every file)", lambda: sum(len(resolve_data(data)) for path, ufd, data in walk_dsk(dsk, file_cache=FileCache()) if data is not None))
+bench("get_block_words x12180", lambda: [dsk.get_block_words(block_id) for block_id in range(len(dsk.disk_words))])
+bench("get_word x10000", lambda: [dsk.get_word(20, i % 256) for i in range(10000)])
@@ -0,0 +1,42 @@
+# Shared bits for the bench scripts, run them from the repo root: python3 bench/bench_open.py
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pydgf.disk import Disk, swab
+from pydgf.ufd import UFD
+
+def add(dsk, sysdr_block_id, name, attributes, data):
+    # Same steps as cli.build_image for one entry, returns the address (the SYS.DR block for directories)
+    ufd = UFD.new()
+    ufd.set_safe_filename(name)
+    ufd.set_file_attributes(attributes)
+    if data is not None: ufd.set_total_byte_count(len(data), ufd.get_file_attributes())
+    return dsk.add_file(sysdr_block_id, ufd, data)
+
+def make_image(dsk_type="4048", directories=20, files=30, max_size=8192, seed=1):
+    # A filled in disk: directories (with a subdirectory each) holding files of every kind
+    rng = random.Random(seed)
+    dsk = Disk.new(dsk_type)
+    for d in range(directories):
+        directory = add(dsk, 6, f"D{d}.DR", "YD", None)
+        subdirectory = add(dsk, directory, "SUB.DR", "YD", None)
+        for f in range(files):
+            add(dsk, subdirectory if f % 4 == 0 else directory, f"F{f}.DA", ["", "C", "D"][f % 3], rng.randbytes(rng.randrange(max_size)))
+    return dsk
+
+def little_endian(dsk):
+    # The same image the way a byte swapped (little endian) dump of the disk has it
+    return bytes(swab(dsk.disk_bytes))
+
+def bench(name, fn, seconds=1):
+    # Runs fn for about seconds (at least 3 times) and prints the average
+    start = time.perf_counter()
+    runs = 0
+    while time.perf_counter() - start < seconds or runs < 3:
+        fn()
+        runs += 1
+    print(f"{name}: {(time.perf_counter() - start) / runs * 1000:.2f} ms")
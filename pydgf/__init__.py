@@ -1,12 +1,25 @@
 import sys
-import argparse
-import gi
-gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gio, GLib
 
-from .dskwindow import DskWindow
+# Importing pydgf (or pydgf.disk, pydgf.ufd, ...) never loads Gtk, only the GUI modules (dskwindow, hexview, cellattributes) import gi.
+# Keep it that way, the command line and scripts run on machines without a display.
+def __getattr__(name):
+    if name == "DskWindow":
+        from .dskwindow import DskWindow
+        return DskWindow
+    raise AttributeError(f"module 'pydgf' has no attribute '{name}'")
 
 def main():
+    from . import cli
+    # Subcommands run headless (see cli.py), anything else opens the GUI
+    if len(sys.argv) > 1 and (sys.argv[1] in ["-h", "--help", "-v", "--verbose"] or sys.argv[1] in cli.COMMANDS):
+        exit(cli.main(sys.argv[1:]))
+
+    import gi
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gtk, Gio, GLib
+
+    from .dskwindow import DskWindow
+
     app = Gtk.Application.new("net.phogon.pydgf", Gio.ApplicationFlags.HANDLES_OPEN | Gio.ApplicationFlags.NON_UNIQUE)
 
     def on_activate(self):
@@ -19,4 +32,4 @@ def main():
             self.add_window(DskWindow(file.get_path()))
     app.connect("open", on_open)
 
-    exit(app.run(sys.argv))
\ No newline at end of file
+    exit(app.run(sys.argv))
@@ -0,0 +1,35 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Run the same work on lots of images (cli.ls_image, cli.fsck_image, ...) over a process pool.
+# function has to be a module level function (it's pickled to the workers), results come back as each image finishes.
+
+def run_image(function, image, options):
+    try:
+        return image, function(image, **options), None
+    except Exception as ex:
+        return image, None, ex
+
+def run_chunk(function, images, options):
+    return [run_image(function, image, options) for image in images]
+
+def process_images(images, function, workers=1, chunk_size=1, **options):
+    # Yields (image, result, exception) for every image, exception is None when it worked.
+    # workers=1 runs in this process (in order), workers=None uses every core. Each worker is sent chunk_size images at a time.
+    if workers == 1:
+        for image in images: yield run_image(function, image, options)
+        return
+    workers = workers or os.cpu_count()
+    images = iter(images)
+    with ProcessPoolExecutor(workers) as executor:
+        # Only keep a couple of chunks per worker queued, images can be a generator over a whole archive
+        pending = set()
+        while True:
+            while len(pending) < workers * 2:
+                chunk = list(itertools.islice(images, chunk_size))
+                if len(chunk) == 0: break
+                pending.add(executor.submit(run_chunk, function, chunk, options))
+            if len(pending) == 0: return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done: yield from future.result()
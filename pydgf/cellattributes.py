@@ -0,0 +1,68 @@
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, GObject
+
+from .attributes import Attributes
+
+class CellEditableAttributes(Gtk.ListBox, Gtk.CellEditable):
+    __gtype_name__ = 'CellEditableAttributes'
+    __gproperties__ = {'editing-canceled' : (bool, '', '', False, GObject.PARAM_READWRITE)}
+
+    def __init__(self, *args):
+        super().__init__()
+        self.attr = Attributes()
+        letters = [
+                "R: Read Protected",
+                "A: Change Attribute Protected",
+                "S: Saved File",
+                "L: Link Entry",
+                "T: Partition Entry",
+                "Y: Directory Entry",
+                # " : Link Resolution (Can't set this)",
+                "N: No Resolution",
+                "I: Direct I/O",
+                "&: User1",
+                "?: User2",
+                # " : UNKNOWN (Can't set this)",
+                "C: Contiguous File",
+                "D: Random File",
+                "P: Permanent File",
+                "W: Write Protected",
+            ]
+        self.checkboxes = []
+        for index, attr_letter in enumerate(letters):
+            cb = Gtk.CheckButton(attr_letter, False)
+            self.checkboxes.append(cb)
+            self.add(self.checkboxes[index])
+
+    def do_editing_done(self):
+        attr_string = ""
+        for index in range(len(self.checkboxes)):
+            if self.checkboxes[index].get_active():
+                attr_string += self.checkboxes[index].get_label()[0:1]
+        self.model[self.path][self.column] = attr_string
+        self.remove_widget()
+    
+    def do_start_editing(self, event): pass
+    def do_remove_widget(self): pass
+
+    def get_text(self): return self.attr.__str__()
+    def set_text(self, attr_string):
+        for index in range(len(self.checkboxes)):
+            if attr_string.__contains__(self.checkboxes[index].get_label()[0:1]):
+                self.checkboxes[index].set_active(True)
+
+class CellRendererAttributes(Gtk.CellRendererText):
+    __gtype_name__ = 'CellRendererAttributes'
+    def __init__(self, column, editable = True):
+        super().__init__(editable = editable)
+        self.column = column
+    def do_start_editing(self, event, treeview, path, background_area, cell_area, flags):
+        if not self.get_property('editable'): return
+        editor = CellEditableAttributes()
+        editor.set_text(self.props.text)
+        editor.model = treeview.get_model()
+        editor.path = path
+        editor.column = self.column
+        editor.show_all()
+        return editor
\ No newline at end of file
@@ -0,0 +1,281 @@
+import argparse
+import datetime
+import os
+import sys
+
+from .disk import Disk, DISK_TYPES, plan_blocks, get_data_block_count
+from .ufd import UFD
+from .magtape import Magtape, write_tape
+from .dumpfile import Dumpfile, DumpfileWriter
+from .filecache import FileCache, LazyFileData, resolve_data, replace_file
+from .batch import process_images
+
+# Headless commands, these must not need gi/Gtk
+COMMANDS = ["ls", "cat", "extract", "build", "info", "fsck"]
+
+def get_image_format(path, fmt=None):
+    if fmt is not None: return fmt
+    if os.path.isdir(path): return "dir"
+    match path.split(".")[-1:][0].lower():
+        case "dsk" | "img": return "dsk"
+        case "9trk": return "9trk"
+        case "dp": return "dp"
+    raise Exception(f"Unknown image format for {path}, use --format")
+
+def walk_image(path, fmt=None, file_cache=None):
+    # (path, ufd, data) for everything in an image, directories come before what's in them.
+    # data is bytes or a LazyFileData (dsk), use resolve_data() when the bytes are needed
+    match get_image_format(path, fmt):
+        case "dsk": yield from walk_dsk(Disk(path, writable=False), file_cache=file_cache or FileCache())
+        case "dp":
+            with open(path, 'rb') as file:
+                for ufd, data in Dumpfile(file).iter_files(True): yield ufd.get_safe_filename(), ufd, data
+        case "9trk":
+            magtape = Magtape(path)
+            for tape_id, tape_data in magtape.files.items():
+                ufd = UFD.new()
+                ufd.set_safe_filename(f"FILE{tape_id:02}")
+                ufd.set_total_byte_count(len(tape_data), '')
+                yield f"FILE{tape_id:02}", ufd, tape_data
+                if len(tape_data) > 0 and tape_data[0] == 0xFF:
+                    # When this happens, it appears to be a DUMP file
+                    try:
+                        files = Dumpfile(tape_data).get_files()
+                    except Exception as ex:
+                        print(f"WARNING: Dumpfile decoding failed, was it really a dump? 9TKFILE {tape_id}: {ex}", file=sys.stderr)
+                        continue
+                    ufd = UFD.new()
+                    ufd.set_safe_filename(f"DUMPFILE{tape_id:02}.DR")
+                    ufd.set_file_attributes("YD")
+                    yield f"DUMPFILE{tape_id:02}.DR", ufd, None
+                    for ufd, data in files: yield f"DUMPFILE{tape_id:02}.DR/{ufd.get_safe_filename()}", ufd, data
+        case "dir": yield from walk_host_directory(path)
+        case fmt: raise Exception(f"Unexpected image format {fmt}")
+
+def walk_dsk(dsk, directory=6, prefix="", file_cache=None):
+    # Same entries the Gtk window shows (no SYS.DR/MAP.DR/links)
+    table = dsk.get_directory_table(directory)
+    for ufd, name in zip(table, table.names.tolist()):
+        if name == "SYS.DR" or name == "MAP.DR": continue
+        if ufd.is_link() or not (ufd.is_file() or ufd.is_dir()): continue
+        data = None
+        if ufd.is_file() and ufd.get_address() >= 16: data = LazyFileData(dsk, ufd, file_cache)
+        yield prefix + name, ufd, data
+        # Prevent Recursion (ufd.get_address() != directory)
+        if ufd.is_dir() and ufd.get_address() != directory:
+            yield from walk_dsk(dsk, ufd.get_address(), prefix + name + "/", file_cache)
+
+def walk_host_directory(root, prefix=""):
+    # Host folders become directories, files are added as sequential files (like dropping them on the window)
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        ufd = UFD.new()
+        ufd.set_safe_filename(entry.name)
+        ufd.set_modified_datetime_from_string(f"{datetime.datetime.fromtimestamp(entry.stat().st_mtime):%x %H:%M}")
+        if entry.is_dir():
+            # Folders without an extension get the usual .DR
+            ufd.set_safe_filename(entry.name if '.' in entry.name else entry.name + ".DR")
+            ufd.set_file_attributes("YD")
+            yield prefix + ufd.get_safe_filename(), ufd, None
+            yield from walk_host_directory(entry.path, prefix + ufd.get_safe_filename() + "/")
+        else:
+            with open(entry.path, 'rb') as file: data = file.read()
+            ufd.set_total_byte_count(len(data), '')
+            yield prefix + ufd.get_safe_filename(), ufd, data
+
+# Per image work (image -> output lines), these run in batch worker processes when --jobs isn't 1
+def ls_image(image, fmt=None):
+    lines = []
+    for path, ufd, data in walk_image(image, fmt):
+        size = "" if ufd.is_dir() else ufd.get_total_byte_count()
+        lines.append(f"{str(ufd.get_file_attributes()):<8} {size:>10} {ufd.get_modified_datetime():%x %H:%M} {path}")
+    return lines
+
+def get_extract_path(output, path):
+    # Host path for an image path, or None if it isn't safe. Names come straight from the image (damaged ones can have anything in them)
+    names = []
+    for name in path.split("/"):
+        # Names without an extension are stored with the '.', the host file doesn't get it
+        if name.endswith("."): name = name[:-1]
+        if name in ["", ".", ".."] or os.sep in name or (os.altsep is not None and os.altsep in name) or "\0" in name: return None
+        names.append(name)
+    host_path = os.path.join(output, *names)
+    if os.path.commonpath([os.path.realpath(output), os.path.realpath(host_path)]) != os.path.realpath(output): return None
+    return host_path
+
+def extract_image(image, output, fmt=None):
+    output = os.path.join(output, os.path.splitext(os.path.basename(image))[0])
+    os.makedirs(output, exist_ok=True)
+    for path, ufd, data in walk_image(image, fmt):
+        host_path = get_extract_path(output, path)
+        if host_path is None:
+            print(f"WARNING: {path!r} not extracted, the name isn't safe to use on this system", file=sys.stderr)
+        elif ufd.is_dir():
+            os.makedirs(host_path, exist_ok=True)
+        elif data is not None:
+            with open(host_path, 'wb') as file: file.write(resolve_data(data))
+    return [f"{image} -> {output}"]
+
+def build_image(source, output=None, dsk_type="6030", frame_size=5, fmt=None):
+    output = output or os.path.splitext(source.rstrip(os.path.sep))[0] + {"9trk": ".9trk", "dp": ".dp"}.get(dsk_type, ".dsk")
+    if os.path.abspath(output) == os.path.abspath(source): raise Exception(f"Not overwriting {source}")
+    if dsk_type == "9trk":
+        # Top level files become the tape files, in order
+        write_tape(output, (resolve_data(data) or b'' for path, ufd, data in walk_image(source, fmt) if '/' not in path and not ufd.is_dir()))
+        return [f"{source} -> {output}"]
+    if dsk_type == "dp":
+        with replace_file(output) as file, DumpfileWriter(file) as writer: writer.write_tree(walk_image(source, fmt))
+        return [f"{source} -> {output}"]
+    entries = list(walk_image(source, fmt))
+    # Check it fits before building anything
+    blocks = plan_blocks([(path, ufd, len(data) if data is not None else 0) for path, ufd, data in entries], dsk_type, frame_size)
+    if blocks > get_data_block_count(dsk_type): raise Exception(f"{source} doesn't fit on a {dsk_type} ({blocks} blocks needed, {get_data_block_count(dsk_type)} free)")
+    dsk = Disk.new(dsk_type, frame_size)
+    # path -> SYS.DR block
+    directories = {"": 6}
+    for path, ufd, data in entries:
+        parent = directories[path.rpartition("/")[0]]
+        ufd = ufd.copy()
+        if data is not None:
+            data = resolve_data(data)
+            ufd.set_total_byte_count(len(data), ufd.get_file_attributes())
+        address = dsk.add_file(parent, ufd, data)
+        if ufd.is_dir(): directories[path] = address
+    with replace_file(output) as file: file.write(dsk.disk_bytes)
+    return [f"{source} -> {output}"]
+
+def info_image(image, fmt=None):
+    lines = [f"{image}:"]
+    frame_size = 5
+    if get_image_format(image, fmt) == "dsk":
+        dsk = Disk(image, writable=False)
+        block_words = dsk.get_block_words(3).tolist()
+        end_of_disk = block_words[5]
+        used_blocks = int(dsk.get_block_map()[16:end_of_disk].sum())
+        frame_size = block_words[6] or 5
+        lines.append(f"\tFrame Size: {block_words[6]}")
+        lines.append(f"\tBlocks Used: {used_blocks} of {end_of_disk - 16}")
+    files = directories = total_bytes = 0
+    entries = []
+    for path, ufd, data in walk_image(image, fmt):
+        if ufd.is_dir():
+            directories += 1
+        else:
+            files += 1
+            total_bytes += ufd.get_total_byte_count()
+        entries.append((path, ufd, len(data) if data is not None else 0))
+    lines.append(f"\tFiles: {files} ({total_bytes} bytes) in {directories} directories")
+    # What it would take to build (cli build) on each disk type
+    for dsk_type in DISK_TYPES:
+        blocks = plan_blocks(entries, dsk_type, frame_size)
+        lines.append(f"\tAs a {dsk_type}: {blocks} of {get_data_block_count(dsk_type)} blocks{'' if blocks <= get_data_block_count(dsk_type) else ' (does not fit)'}")
+    return lines
+
+def fsck_dump(dumpfile, verify=False):
+    # Damaged spans of a dump, reading carries on past them. DATA checksums are only checked with verify (the checksum rule is a guess, see dumpfile.get_data_checksums)
+    for ufd, data in dumpfile.iter_files(True, verify=verify, recover=True): pass
+    return [f"offset {start}-{end}: {problem}" for start, end, problem in dumpfile.damaged]
+
+def fsck_image(image, fmt=None, verify=False):
+    # Problems found, dsk images get a full check, dumps (and dumps on tapes) are checked for damage, other formats just have to decode
+    match get_image_format(image, fmt):
+        case "dsk": return [f"{image}: {problem}" for problem in Disk(image, writable=False).check()]
+        case "dp":
+            with open(image, 'rb') as file: return [f"{image}: {problem}" for problem in fsck_dump(Dumpfile(file), verify)]
+        case "9trk":
+            problems = []
+            magtape = Magtape(image)
+            for tape_id, tape_data in magtape.files.items():
+                if len(tape_data) > 0 and tape_data[0] == 0xFF:
+                    problems += [f"{image}: FILE{tape_id:02}: {problem}" for problem in fsck_dump(Dumpfile(tape_data), verify)]
+            return problems
+    for path, ufd, data in walk_image(image, fmt): pass
+    return []
+
+def run(args, function, images, show_headers=False, show_lines=True, **options):
+    # Print each image's lines as it finishes, returns the exit code
+    failed = 0
+    for image, lines, ex in process_images(images, function, args.jobs or None, args.chunk_size, **options):
+        if ex is not None:
+            print(f"pydgf: {image}: {ex}", file=sys.stderr)
+            failed += 1
+            continue
+        if show_headers: print(f"{image}:")
+        if show_lines:
+            for line in lines: print(line, flush=True)
+    return 1 if failed > 0 else 0
+
+def ls(args):
+    return run(args, ls_image, args.images, show_headers=len(args.images) > 1, fmt=args.format)
+
+def get_cat_name(path):
+    # Same matching as Disk.lookup, ':' or '/' separated and names without an extension are stored with the '.'
+    return "/".join(name if '.' in name else name + '.' for name in path.upper().replace(':', '/').split('/') if len(name) > 0)
+
+def cat(args):
+    names = [get_cat_name(name) for name in args.names]
+    found = set()
+    for path, ufd, data in walk_image(args.image, args.format):
+        path = get_cat_name(path)
+        if path in names and data is not None:
+            sys.stdout.buffer.write(resolve_data(data))
+            found.add(path)
+    for arg_name, name in zip(args.names, names):
+        if name not in found: print(f"pydgf: {arg_name}: No such file in {args.image}", file=sys.stderr)
+    return 0 if len(found) == len(set(names)) else 1
+
+def extract(args):
+    return run(args, extract_image, args.images, show_lines=args.verbose, output=args.output, fmt=args.format)
+
+def build(args):
+    if args.output is not None and len(args.sources) > 1: raise Exception("--output only works with one source")
+    return run(args, build_image, args.sources, show_lines=args.verbose, output=args.output, dsk_type=args.type, frame_size=args.frame_size, fmt=args.format)
+
+def info(args):
+    return run(args, info_image, args.images, fmt=args.format)
+
+def fsck(args):
+    failed = 0
+    for image, problems, ex in process_images(args.images, fsck_image, args.jobs or None, args.chunk_size, fmt=args.format, verify=args.verify_checksums):
+        if ex is not None: problems = [f"{image}: {ex}"]
+        for problem in problems: print(problem, flush=True)
+        if len(problems) == 0 and args.verbose: print(f"{image}: OK", flush=True)
+        if len(problems) > 0: failed += 1
+    return 1 if failed > 0 else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pydgf", description="Data General RDOS disk/tape image tool (no arguments starts the GUI)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    def add_command(name, function, help):
+        command = subparsers.add_parser(name, help=help)
+        command.set_defaults(function=function)
+        command.add_argument("-f", "--format", choices=["dsk", "9trk", "dp", "dir"], help="image format (default: from the extension)")
+        command.add_argument("-j", "--jobs", type=int, default=1, help="images to work on at once in worker processes (0: one per core)")
+        command.add_argument("--chunk-size", type=int, default=1, help="images sent to a worker at a time")
+        return command
+
+    command = add_command("ls", ls, "list the files in images")
+    command.add_argument("images", nargs="+")
+    command = add_command("cat", cat, "write files from an image to stdout")
+    command.add_argument("image")
+    command.add_argument("names", nargs="+", help="path in the image (DIR.DR/FILE.SV or DIR.DR:FILE.SV)")
+    command = add_command("extract", extract, "extract images to host folders (one per image)")
+    command.add_argument("-o", "--output", default=".", help="folder to extract into")
+    command.add_argument("images", nargs="+")
+    command = add_command("build", build, "build dsk (or 9trk/dp) images from host folders or other images")
+    command.add_argument("-o", "--output", help="dsk to write (default: SOURCE.dsk)")
+    command.add_argument("-t", "--type", choices=list(DISK_TYPES) + ["9trk", "dp"], default="6030")
+    command.add_argument("--frame-size", type=int, default=5)
+    command.add_argument("sources", nargs="+")
+    command = add_command("info", info, "show disk info and usage")
+    command.add_argument("images", nargs="+")
+    command = add_command("fsck", fsck, "check images for problems (dsk structure, dump damage)")
+    command.add_argument("--verify-checksums", action="store_true", help="also check dump DATA checksums (the checksum rule hasn't been checked against real dumps, mismatches may not be damage)")
+    command.add_argument("images", nargs="+")
+
+    args = parser.parse_args(argv)
+    try:
+        return args.function(args) or 0
+    except Exception as ex:
+        print(f"pydgf: {ex}", file=sys.stderr)
+        return 1
@@ -0,0 +1,57 @@
+import numpy as np
+
+from .ufd import UFD, UFDTable
+
+class DirectoryIndex:
+    # In memory index of one SYS.DR, built once (See Disk.get_directory) and kept in sync by Disk.add_ufd.
+    # Entries go in the first frame (starting at the UFD hash, see UFD.get_sysdr_fib_offset) with a free slot.
+    def __init__(self, disk, sysdr_block_id):
+        self.disk = disk
+        self.sysdr_block_id = sysdr_block_id
+        self.frame_size = disk.get_disk_frame_size()
+        # filename -> (fib_index, entry_index)
+        self.entries = {}
+        # fib_index -> sorted free entry indexes of that entry block
+        self.free_slots = {}
+        # hash -> first fib_index that might have a free slot, so adding to a big directory doesn't probe the full frames
+        self.first_free = {}
+
+        fib_words = disk.get_sysdr_words(sysdr_block_id)
+        fib_indexes = np.flatnonzero(fib_words)
+        debs = disk.disk_words[fib_words[fib_indexes]]
+        ufd_words = debs[:, 1:253].reshape(-1, 14, 18)
+        # Same rules as Disk.get_directory_table for what's in use, any slot with a zero first word can be reused
+        free = ufd_words[:, :, 0] == 0
+        in_use = (np.arange(14) < debs[:, 0:1]) & ~free
+        deb_rows, entry_indexes = np.nonzero(in_use)
+        for name, fib_index, entry_index in zip(UFDTable(ufd_words[in_use]).names.tolist(), fib_indexes[deb_rows].tolist(), entry_indexes.tolist()):
+            self.entries.setdefault(name, (fib_index, entry_index))
+        for fib_index in fib_indexes.tolist(): self.free_slots[fib_index] = []
+        deb_rows, entry_indexes = np.nonzero(free)
+        for fib_index, entry_index in zip(fib_indexes[deb_rows].tolist(), entry_indexes.tolist()):
+            self.free_slots[fib_index].append(entry_index)
+
+    def __contains__(self, name): return name in self.entries
+    def __len__(self): return len(self.entries)
+
+    def get_fib_block(self, fib_index): return self.disk.get_sysdr_word(self.sysdr_block_id, fib_index)
+
+    def lookup(self, name):
+        # UFD is a view into the entry block, changes are made on the disk
+        if name not in self.entries: return None
+        fib_index, entry_index = self.entries[name]
+        return UFD(self.disk.disk_words[self.get_fib_block(fib_index), (entry_index*18)+1:(entry_index*18)+19])
+
+    def find_free_slot(self, ufd):
+        # (fib_index, entry_index) or None when all the frames for this hash are full
+        offset = ufd.get_sysdr_fib_offset(self.frame_size)
+        fib_index = self.first_free.get(offset, offset)
+        while fib_index in self.free_slots and len(self.free_slots[fib_index]) == 0:
+            fib_index += self.frame_size
+        self.first_free[offset] = fib_index
+        if fib_index not in self.free_slots: return None
+        return fib_index, self.free_slots[fib_index][0]
+
+    def insert(self, name, fib_index, entry_index):
+        self.free_slots[fib_index].remove(entry_index)
+        self.entries[name] = (fib_index, entry_index)
@@ -1,7 +1,85 @@
-from .ufd import UFD 
+import mmap
+import os
+import sys
+import numpy as np
+
+from .ufd import UFD, UFDTable
+from .diskfile import DiskFile
+from .directory import DirectoryIndex
+
+def swab(data):
+    # Swap the bytes of every 16-bit word (like `dd conv=swab`), an odd trailing byte is left as is
+    swapped = bytearray(data)
+    np.frombuffer(swapped, dtype='<u2', count=len(swapped)//2).byteswap(inplace=True)
+    return swapped
+
+# dsk_type: (blocks in image, tracks, sectors/track, usable blocks, disk type code)
+DISK_TYPES = {
+    "6030": (616, 1, 8, 610, 2),
+    "4048": (12180, 10, 6, 12174, 0), # Disk type code, is this really 0?
+}
+
+# Block planning, how many blocks Disk.new + add_file will use without building anything.
+# Files are allocated from block 16 on (after MAP.DR's first block), a new disk has no holes so the counts are exact.
+def get_map_dr_block_count(end_of_disk):
+    # 4096 blocks (256 words of 16 bits) per MAP.DR block, the map starts at block 6
+    return (end_of_disk - 6 + 4095) // 4096
+
+def get_data_block_count(dsk_type):
+    # Blocks plan_blocks has to fit in (16 up to the end of the disk)
+    return DISK_TYPES[dsk_type][3] - 16
+
+def get_file_block_count(attributes, size):
+    # Same rules as add_file: sequential blocks hold 510 bytes (+ link word), random files also have an index block per 255 blocks
+    if size == 0: return 1
+    if attributes.is_contiguous(): return (size + 511) // 512
+    if attributes.is_random():
+        block_count = (size + 511) // 512
+        return block_count + (block_count + 254) // 255
+    return (size + 509) // 510
+
+def get_name_fib_offset(name, frame_size):
+    ufd = UFD.new()
+    ufd.set_safe_filename(name)
+    return ufd.get_sysdr_fib_offset(frame_size)
+
+def get_directory_block_count(fib_offsets, frame_size):
+    # Frames and extra index blocks of a SYS.DR (not its first index block), fib_offsets are the hashes of everything in it (SYS.DR and MAP.DR too).
+    # A frame has an entry block (14 entries) for each hash, the directory grows a frame at a time when a hash runs out of room
+    counts = np.bincount(np.asarray(fib_offsets, dtype=np.int64), minlength=frame_size)
+    return get_frames_block_count(int(counts.max()), frame_size)
+
+def get_frames_block_count(max_names, frame_size):
+    # Same as get_directory_block_count when the hash with the most names has max_names of them
+    frames = max((max_names + 13) // 14, 1)
+    return frames * frame_size + (frames * frame_size + 254) // 255 - 1
+
+def plan_blocks(entries, dsk_type="6030", frame_size=5):
+    # Blocks from 16 on a new dsk_type disk with entries added would use (compare with get_data_block_count)
+    # entries are (path, ufd, size) like cli.walk_image (with the size instead of the data), directories come before what's in them
+    loopback_offsets = [get_name_fib_offset("SYS.DR", frame_size), get_name_fib_offset("MAP.DR", frame_size)]
+    # path -> hashes of everything in that directory
+    directories = {"": list(loopback_offsets)}
+    blocks = get_map_dr_block_count(DISK_TYPES[dsk_type][3]) - 1
+    for path, ufd, size in entries:
+        directories[path.rpartition("/")[0]].append(ufd.get_sysdr_fib_offset(frame_size))
+        if ufd.is_dir():
+            directories[path] = list(loopback_offsets)
+            blocks += 1 # First SYS.DR index block, the root's is block 6
+        else:
+            blocks += get_file_block_count(ufd.get_file_attributes(), size)
+    for fib_offsets in directories.values(): blocks += get_directory_block_count(fib_offsets, frame_size)
+    return blocks
 
 class Disk:
-    def __init__(self, disk_bytes, byteorder=None):
+    # disk_bytes can also be a path, the image is then memory mapped and only paged in as blocks are touched.
+    # Edits to a mapped image stay in memory (ACCESS_COPY) unless writable is False, then the map is read only.
+    def __init__(self, disk_bytes, byteorder=None, writable=True):
+        if isinstance(disk_bytes, (str, os.PathLike)):
+            with open(disk_bytes, 'rb') as file:
+                disk_bytes = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY if writable else mmap.ACCESS_READ)
+        if len(disk_bytes) % 512 != 0: raise Exception("Unexpected disk length")
+
         def is_byte_order(isbyteorder):
             # Checksum is the first 8 words
             checksum = 0
@@ -18,52 +96,106 @@ class Disk:
             else: raise Exception("Could not determine byteorder automatically, force byteorder to continue")
         
         # Validate byteorder is correct, warn if it doesn't look right
-        if not is_byte_order(byteorder): print("WARNING: byteorder looks wrong, decoding may result in invalid data!")
+        if not is_byte_order(byteorder): print("WARNING: byteorder looks wrong, decoding may result in invalid data!", file=sys.stderr)
         
         match byteorder:
             case 'little':
-                self.disk_bytes = memoryview(bytearray(disk_bytes))
-                for i in range(len(disk_bytes)//2):
-                    new_value = int.from_bytes(disk_bytes[i*2:(i*2)+2], 'little')
-                    self.disk_bytes[i*2:(i*2)+2] = new_value.to_bytes(2, 'big')
+                self.disk_bytes = memoryview(swab(disk_bytes))
+            case 'big' if isinstance(disk_bytes, mmap.mmap):
+                self.disk_bytes = memoryview(disk_bytes)
             case 'big':
                 self.disk_bytes = memoryview(bytearray(disk_bytes))
             case _: raise Exception("HOW!?!?")
+        # Big endian word view (blocks, 256) sharing memory with disk_bytes
+        self.disk_words = np.frombuffer(self.disk_bytes, dtype='>u2').reshape(-1, 256)
+        # See get_block_map
+        self._block_map = None
+        # See get_directory
+        self._directories = {}
+        # SYS.DR block -> (parent SYS.DR block, name), for directories added with add_file
+        self._directory_parents = {}
+
+    @classmethod
+    def new(cls, dsk_type="6030", frame_size=5, special_blocks={}):
+        # Formatted empty disk. special_blocks ({block_id: data}) are copied in raw first, block 0 can take 1024 bytes (HIPBOOT)
+        if dsk_type not in DISK_TYPES: raise Exception("Unexpected dsk type passed")
+        image_blocks, tracks, sectors, usable_blocks, disk_type_code = DISK_TYPES[dsk_type]
+        dsk = cls(b'\x00'*512*image_blocks, 'big')
+
+        # ADD RAW SYSTEM SECTORS AS NEEDED
+        # Block 0,1 - HIPBOOT (BOOT SECTOR)
+        # Block 2 - Unused
+        # Block 3 - Pointers ("DiskInfo") (This will be modified slightly later)
+        # Block 5 - Unused
+        # Block 7 - SWAP FIB POINTERS
+        # Block 8,9,10,11,12,13,14 - "UNUSED"
+        for block_id, data in special_blocks.items():
+            if block_id not in [0,2,3,5,7,8,9,10,11,12,13,14]: raise Exception(f"Block {block_id} can't be a special block")
+            if len(data) > (1024 if block_id == 0 else 512): raise Exception("Special block is too big")
+            dsk.disk_bytes[(block_id*512):(block_id*512)+len(data)] = data
+            if block_id >= 6: dsk.set_map_block_bit(block_id)
+
+        # Block 3 - Pointers ("DiskInfo")
+        dsk.set_word(3, 0, 2) # REV 5
+        dsk.set_word(3, 2, tracks) # Tracks
+        dsk.set_word(3, 3, sectors) # Sectors/Track
+        dsk.set_word(3, 5, usable_blocks) # NumOfBlocks (Technically words 4+5)
+        dsk.set_word(3, 7, disk_type_code) # DiskType
+        # set_disk_frame_size also fixes the checksum
+        dsk.set_disk_frame_size(frame_size)
+
+        # Block 4 - Remap Area
+        dsk.set_word(4, 0, 4)
+        dsk.set_word(4, 2, image_blocks)
+
+        # Block 6 - SYS.DR
+        dsk.set_map_block_bit(6)
+
+        # Block 7 - SWAP FIB POINTERS
+        # FrameSize compat/mirror (word 17) is updated from Block3 set_disk_frame_size()
 
+        # Block 15+ - MAP.DR (bigger disks need more then one block)
+        for i in range(dsk.get_map_block_count()):
+            dsk.set_map_block_bit(15 + i)
+
+        # ALLOCATE ROOT SYS.DR FRAMES
+        dsk.add_frames_to_sysdr_block(6)
+        return dsk
+
+    # NOTE: Returns a view into the disk, use .tolist() before doing math that could overflow 16 bits
     def get_block_words(self, block_id):
-        if block_id > len(self.disk_bytes) / 512 or block_id < 0: raise Exception("Tried to access outside the disk!")
-        block_words = [0]*256
-        for i in range(256):
-            block_words[i] = int.from_bytes(self.disk_bytes[(block_id*512)+(i*2):(block_id*512)+(i*2)+2], byteorder='big')
-        return block_words
+        if block_id >= len(self.disk_words) or block_id < 0: raise Exception("Tried to access outside the disk!")
+        return self.disk_words[block_id]
     def get_word(self, block_id, word_offset):
-        if block_id > len(self.disk_bytes) / 512 or block_id < 0: raise Exception("Tried to access outside the disk!")
-        if word_offset > 256 or word_offset < 0: raise Exception("Offset outside range")
-        return int.from_bytes(self.disk_bytes[(block_id*512)+(word_offset*2):(block_id*512)+(word_offset*2)+2], byteorder='big')
+        if block_id >= len(self.disk_words) or block_id < 0: raise Exception("Tried to access outside the disk!")
+        if word_offset >= 256 or word_offset < 0: raise Exception("Offset outside range")
+        return int(self.disk_words[block_id, word_offset])
     def set_word(self, block_id, word_offset, value):
-        if block_id > len(self.disk_bytes) / 512 or block_id < 0: raise Exception("Tried to access outside the disk!")
-        if word_offset > 256 or word_offset < 0: raise Exception("Offset outside range")
+        if block_id >= len(self.disk_words) or block_id < 0: raise Exception("Tried to access outside the disk!")
+        if word_offset >= 256 or word_offset < 0: raise Exception("Offset outside range")
         if value > 0xFFFF or value < 0: raise Exception("Value outside range")
-        self.disk_bytes[(block_id*512)+(word_offset*2):(block_id*512)+(word_offset*2)+2] = value.to_bytes(2, 'big')
+        self.disk_words[block_id, word_offset] = value
 
     def get_disk_frame_size(self):
         # TODO: Should be able to determine/validate this by looking for SYS.DR loopback at correct hash
-        diskinfo_frame_size = self.get_block_words(3)[6]
-        other_frame_size = self.get_block_words(7)[17]
+        diskinfo_frame_size = self.get_word(3, 6)
+        other_frame_size = self.get_word(7, 17)
         if diskinfo_frame_size != 0:
             if diskinfo_frame_size != other_frame_size:
-                print(f"WARNING: dsk frame_size(s) don't match! Using first one {diskinfo_frame_size} != {other_frame_size}")
+                print(f"WARNING: dsk frame_size(s) don't match! Using first one {diskinfo_frame_size} != {other_frame_size}", file=sys.stderr)
             return diskinfo_frame_size
         elif other_frame_size != 0:
-            print(f"WARNING: dsk info frame_size is zero?!? Returning REV4? backup")
+            print(f"WARNING: dsk info frame_size is zero?!? Returning REV4? backup", file=sys.stderr)
             return other_frame_size
         else:
-            print(f"WARNING: dsk frame_size(s) are zero?!?")
+            print(f"WARNING: dsk frame_size(s) are zero?!?", file=sys.stderr)
             return None
     def set_disk_frame_size(self, frame_size):
         self.set_word(3, 6, frame_size)
         self.set_word(7, 17, frame_size)
         self.fix_diskinfo_checksum()
+        # Hashes change with the frame size
+        self._directories.clear()
 
     def fix_diskinfo_checksum(self):
         checksum = 0
@@ -76,7 +208,7 @@ class Disk:
     def dump_diskinfo(self, indent = 0):
         print(f"{'\t'*indent}Disk Info:")
         indent += 1
-        block_words = self.get_block_words(3)
+        block_words = self.get_block_words(3).tolist()
         match block_words[0]:
             case 0:
                 print(f"{'\t'*indent}RevCode: 4.02")
@@ -109,13 +241,13 @@ class Disk:
             case 1:
                 print(f"{'\t'*indent}Disk Type Code: 4231 CONTROLLER ({block_words[7]})")
             case 0:
-                print(f"{'\t'*indent}Disk Type Code: ?4048 DRIVE? ({blockWords[7]})")
+                print(f"{'\t'*indent}Disk Type Code: ?4048 DRIVE? ({block_words[7]})")
             case _:
                 print(f"{'\t'*indent}Disk Type Code: ? ({block_words[7]})")
     def dump_remap(self, indent = 0):
         print(f"{'\t'*indent}Remap Info:")
         indent += 1
-        block_words = self.get_block_words(4)
+        block_words = self.get_block_words(4).tolist()
         print(f"{'\t'*indent}# Valid Words: {block_words[0]}")
         print(f"{'\t'*indent}Start of Remap Area: {block_words[1]*512 + block_words[2]}")
         print(f"{'\t'*indent}Size of Remap Area: {block_words[3]}")
@@ -124,7 +256,7 @@ class Disk:
     def dump_swappointers(self, indent = 0):
         print(f"{'\t'*indent}Swap Pointers:")
         indent += 1
-        block_words = self.get_block_words(7)
+        block_words = self.get_block_words(7).tolist()
         print(f"{'\t'*indent}BG1 FileIndexBlock Address: {block_words[1]*512 + block_words[2]}")
         print(f"{'\t'*indent}BG2 FileIndexBlock Address: {block_words[3]*512 + block_words[4]}")
         print(f"{'\t'*indent}BG3 FileIndexBlock Address: {block_words[5]*512 + block_words[6]}")
@@ -146,34 +278,49 @@ class Disk:
         self.dump_directory(6, indent)
     def dump_directory(self, address, indent=0):
         frame_size = self.get_disk_frame_size()
-        block_words = self.get_block_words(address)
-        # FIXME: This isn't quite right for decoding, its 255 with a link
-        for i in range(255):
-            if block_words[i] > 0:
-                deb = self.get_block_words(block_words[i])
-                entries = deb[0]
-                if entries > 14:
-                    print(f"address: {address}")
-                    print(f"frame_size: {frame_size}")
-                    print(f"i: {i}")
-                    print(f"block_words[i]: {block_words[i]}")
-                    print(f"deb: {deb}")
-                    print(f"entries: {entries}")
-                    print(f"? {self.get_word(block_words[i], 0)}")
-                    raise Exception("Unexpected number of entries")
-                for e in range(entries):
-                    ufd_start = (e*18)+1
-                    ufd_end = ((e+1)*18)+1
-                    ufd = UFD(deb[ufd_start:ufd_end])
-                    
-                    if ufd.is_deleted():
-                        # print(f"{'\t'*indent}*** FILE IS DELETED: {ufd.getSafeFilename()}")
-                        continue
-
-                    ufd.dump(indent, frame_size, i)
-
-                    if ufd.is_dir() and ufd.get_address() != address:
-                        self.dump_directory(ufd.get_address(), indent=indent+1)
+        table = self.get_directory_table(address)
+        for ufd, fib_index in zip(table, table.fib_indexes.tolist()):
+            ufd.dump(indent, frame_size, fib_index)
+
+            if ufd.is_dir() and ufd.get_address() != address:
+                self.dump_directory(ufd.get_address(), indent=indent+1)
+
+    def get_directory_table(self, address):
+        # Decode every in use UFD of a SYS.DR in one go
+        fib_words = self.get_sysdr_words(address)
+        fib_indexes = np.flatnonzero(fib_words)
+        debs = self.disk_words[fib_words[fib_indexes]]
+        entries = debs[:, 0]
+        if (entries > 14).any():
+            raise Exception(f"Unexpected number of entries (SYS.DR {address}, entry blocks {fib_words[fib_indexes][entries > 14].tolist()})")
+        ufd_words = debs[:, 1:253].reshape(-1, 14, 18)
+        # Only the first "entries" UFDs of each block are looked at, then skip deleted ones
+        in_use = (np.arange(14) < entries[:, None]) & (ufd_words[:, :, 0] != 0)
+        return UFDTable(ufd_words[in_use], np.broadcast_to(fib_indexes[:, None], in_use.shape)[in_use])
+
+    def get_file_blocks(self, ufd):
+        # Every block a file or directory uses (index blocks included), files always have at least one block
+        address = ufd.get_address()
+        if address < 16 or ufd.is_link(): return []
+        if ufd.is_dir(): return self.get_directory_blocks(address)
+        count = ufd.get_logical_block_count() + (1 if ufd.get_bytes_in_last_block() > 0 else 0)
+        if ufd.is_random():
+            index_blocks = self.get_random_index_blocks(address, max(count, 1))
+            return index_blocks + self.get_random_block_addresses(address, count).tolist()
+        elif ufd.is_contiguous():
+            return list(range(address, address + max(count, 1)))
+        else:
+            blocks = []
+            previous_address = 0
+            while len(blocks) < max(count, 1):
+                if address == 0 or address >= len(self.disk_words): raise Exception("Sequential file is incomplete")
+                blocks.append(address)
+                address, previous_address = previous_address ^ self.get_word(address, 255), address
+            return blocks
+    def get_directory_blocks(self, sysdr_block_id):
+        # SYS.DR index blocks and its entry blocks
+        sysdr_words = self.get_sysdr_words(sysdr_block_id)
+        return self.get_index_chain(sysdr_block_id) + sysdr_words[sysdr_words != 0].tolist()
 
     def get_file_bytes(self, ufd):
         # DOES NOT SUPPORT 2WORD DRIVES
@@ -182,7 +329,8 @@ class Disk:
         address = ufd.get_address()
         if address < 16: return # THIS WOULD MEAN IT'S A "SYSTEM" area and shouldn't get read here (ex: MAP.DR)
         attr = ufd.get_file_attributes()
-        data = b''
+        count = ufd.get_logical_block_count()
+        last_block_bytes = ufd.get_bytes_in_last_block()
 
         if attr.is_dir():
             # Directory, just skip the data
@@ -191,93 +339,179 @@ class Disk:
             # LINK, don't bother following to get data
             return
         elif attr.is_random():
-            part = 0
-            count = ufd.get_logical_block_count()
-            if count > 510:
-                # FIXME: Need to support reading the last word so we get the next FIB
-                raise Exception("UNSUPPORTED LARGE RANDOM FILE")
-            while part <= count:
-                part_address = int.from_bytes(self.disk_bytes[(address*512)+(part*2):(address*512)+(part*2)+2], byteorder='big')
-                if part == count:
-                    data += self.disk_bytes[part_address*512:(part_address*512)+ufd.get_bytes_in_last_block()]
-                else:
-                    data += self.disk_bytes[part_address*512:(part_address*512)+512]
-                part += 1
-            return data
+            part_addresses = self.get_random_block_addresses(address, count+1)
+            return self.disk_words.view(np.uint8)[part_addresses].reshape(-1)[0:(count*512)+last_block_bytes].tobytes()
         elif attr.is_contiguous():
-            # CONTIGUOUS FILE
-            count = ufd.get_logical_block_count()
-            # print(f"{ufd.get_safe_filename()}: {ufd.get_file_attribute_string()} {ufd.get_address()} {count} {ufd.get_total_byte_count()}")
-            for i in range(count+1):
-                if i == count: data += self.disk_bytes[(address+i)*512:((address+i)*512)+ufd.get_bytes_in_last_block()]
-                else: data += self.disk_bytes[(address+i)*512:((address+i)*512)+512]
-            return data
+            # CONTIGUOUS FILE, copied like the others so editing the disk doesn't change it (use open() to read without a copy)
+            return self.disk_bytes[address*512:(address*512)+(count*512)+last_block_bytes].tobytes()
         elif attr.is_sequential():
             # SEQ FILE IF NOT CONT/RANDOM
+            parts = []
             try:
-                count = ufd.get_logical_block_count()
                 previous_address = 0
                 for i in range(count+1):
                     if i == count:
-                        data += self.disk_bytes[address*512:(address*512)+ufd.get_bytes_in_last_block()]
+                        parts.append(self.disk_bytes[address*512:(address*512)+last_block_bytes])
                     else:
-                        data += self.disk_bytes[address*512:(address*512)+510]
-                    next_address = int.from_bytes(self.disk_bytes[(address*512)+510:(address*512)+512], byteorder='big')
+                        parts.append(self.disk_bytes[address*512:(address*512)+510])
+                    next_address = int(self.disk_words[address, 255])
                     temp = address
                     address = previous_address ^ next_address # YES REALLY
                     previous_address = temp
-                return data
-            finally:
-                return data
+            except Exception as ex:
+                print(f"WARNING: Sequential file {ufd.get_safe_filename()} is incomplete: {ex}", file=sys.stderr)
+            return b''.join(parts)
+
+    # Random files have an index of block addresses, 255 per index block.
+    # The last word of an index block links to the next one the same way sequential files do (previous ^ next).
+    # NOTE: That link is a guess (the same as SYS.DR's index blocks here), no RDOS written random file with more then 255 blocks was checked.
+    # Files of up to 255 blocks have one index block and don't depend on it, see the README
+    def get_random_index_blocks(self, address, count):
+        index_blocks = []
+        previous_block = 0
+        block = address
+        while len(index_blocks)*255 < count:
+            if block == 0 or block >= len(self.disk_words): raise Exception("Random file index is incomplete")
+            index_blocks.append(block)
+            block, previous_block = previous_block ^ self.get_word(block, 255), block
+        return index_blocks
+    def get_index_chain(self, address):
+        # Every index block linked from address (Used for SYS.DR, its frames are indexed like a random file)
+        chain = [address]
+        previous_block = 0
+        while True:
+            next_block = previous_block ^ self.get_word(chain[-1], 255)
+            if next_block == 0: return chain
+            if next_block in chain or next_block >= len(self.disk_words): raise Exception(f"Index block chain from {address} is broken")
+            previous_block = chain[-1]
+            chain.append(next_block)
+    def get_random_block_addresses(self, address, count):
+        index_blocks = self.get_random_index_blocks(address, count)
+        return self.disk_words[index_blocks, 0:255].reshape(-1)[0:count]
+    def set_random_index(self, index_blocks, block_addresses):
+        for i, index_block in enumerate(index_blocks):
+            previous_block = index_blocks[i-1] if i > 0 else 0
+            next_block = index_blocks[i+1] if i+1 < len(index_blocks) else 0
+            entries = block_addresses[i*255:(i+1)*255]
+            self.disk_words[index_block] = 0
+            self.disk_words[index_block, 0:len(entries)] = entries
+            self.disk_words[index_block, 255] = previous_block ^ next_block
+
+    def write_blocks(self, block_ids, data, block_size=512):
+        # Spread data over the blocks, block_size bytes to each (510 for sequential so the link word is kept)
+        data = np.frombuffer(data, dtype=np.uint8)
+        full_blocks, last_block_bytes = divmod(len(data), block_size)
+        disk_blocks = self.disk_words.view(np.uint8)
+        disk_blocks[block_ids[0:full_blocks], 0:block_size] = data[0:full_blocks*block_size].reshape(-1, block_size)
+        if last_block_bytes > 0: disk_blocks[block_ids[full_blocks], 0:last_block_bytes] = data[full_blocks*block_size:]
 
+    def open(self, ufd):
+        # File like (io.RawIOBase) reader, use this instead of get_file_bytes to stream big files
+        return DiskFile(self, ufd)
+
+    # MAP.DR (Block 15+) is a bitmap of blocks in use, starting at block 6 (MSB first)
+    # It's loaded once into block_map (in use flag per block) and every change is written back to MAP.DR as it's made
+    def get_block_map(self):
+        if self._block_map is None:
+            block_count = len(self.disk_words)
+            map_words = self.disk_words.reshape(-1)[15*256:(15*256)+((block_count - 6 + 15) // 16)]
+            self._block_map = np.ones(block_count, dtype=bool)
+            self._block_map[6:] = np.unpackbits(map_words.view(np.uint8))[0:block_count-6]
+            # Everything before this block is known to be in use
+            self._free_hint = 16
+            self._free_extents = None
+        return self._block_map
+    def write_block_map(self, start_block, end_block):
+        # Write the MAP.DR words covering start_block up to (not including) end_block
+        block_map = self.get_block_map()
+        start_word = (start_block - 6) // 16
+        end_word = (end_block - 6 + 15) // 16
+        bits = np.zeros((end_word - start_word) * 16, dtype=bool)
+        map_bits = block_map[6 + (start_word*16):6 + (end_word*16)]
+        bits[0:len(map_bits)] = map_bits
+        self.disk_words.reshape(-1)[(15*256)+start_word:(15*256)+end_word] = np.packbits(bits).view('>u2')
+        self._free_extents = None
+
+    def get_map_block_count(self):
+        return get_map_dr_block_count(self.get_word(3, 5))
     def set_map_block_bit(self, block_id):
-        print(f"set_map_block_bit({block_id})")
-        word = (block_id - 6) // 16
-        bit = 15 - ((block_id - 6) % 16)
-        map_block = 15 + (word // 256)
-        map_word = word % 256
-        self.set_word(map_block, map_word, self.get_word(map_block, map_word) | (1<<bit))
+        self.get_block_map()[block_id] = True
+        self.write_block_map(block_id, block_id + 1)
     def get_map_block_word(self, block_id):
         word = (block_id - 6) // 16
         map_block = 15 + (word // 256)
         map_word = word % 256
         return self.get_word(map_block, map_word)
     def get_map_block_bit(self, block_id):
-        word = (block_id - 6) // 16
-        map_block = 15 + (word // 256)
-        map_word = word % 256
-        bit = 15 - ((block_id - 6) % 16)
-        return (self.get_word(map_block, map_word) & (1<<bit)) == 0
+        # True when the block is free
+        return not self.get_block_map()[block_id]
+    def get_free_extents(self):
+        # (start blocks, lengths) of every run of free blocks
+        if self._free_extents is None:
+            end_of_disk = self.get_word(3, 5)
+            free = np.zeros(max(end_of_disk - 16, 0) + 2, dtype=np.int8)
+            free[1:-1] = ~self.get_block_map()[16:end_of_disk]
+            edges = np.diff(free)
+            starts = np.flatnonzero(edges == 1)
+            self._free_extents = (starts + 16, np.flatnonzero(edges == -1) - starts)
+        return self._free_extents
     def allocate_blocks(self, count):
-        start_block = 16
+        block_map = self.get_block_map()
         end_of_disk = self.get_word(3, 5)
 
-        while start_block < end_of_disk:
-            # Fast path full words
-            if self.get_map_block_word(start_block) == 0xFFFF:
-                start_block = (((start_block + 10) // 16) * 16) + 6
-                continue
-            range_start = start_block
-            for bc in range(count):
-                if self.get_map_block_bit(start_block) == False: break
-                start_block += 1
-            if range_start + count == start_block:
-                for i in range(count): self.set_map_block_bit(range_start + i)
-                return range_start
-            start_block += 1
-        raise Exception("OUT OF SPACE")
+        if count == 1:
+            # Single blocks, take the first free one
+            candidates = block_map[self._free_hint:end_of_disk]
+            index = int(candidates.argmin()) if len(candidates) > 0 else 0
+            if len(candidates) == 0 or candidates[index]: raise Exception("OUT OF SPACE")
+            start_block = self._free_hint + index
+            self._free_hint = start_block + 1
+        else:
+            # Contiguous blocks, use the smallest free run that fits (best fit)
+            starts, lengths = self.get_free_extents()
+            fits = np.flatnonzero(lengths >= count)
+            if len(fits) == 0: raise Exception("OUT OF SPACE")
+            start_block = int(starts[fits[lengths[fits].argmin()]])
+
+        block_map[start_block:start_block+count] = True
+        self.write_block_map(start_block, start_block + count)
+        return start_block
+
+    def allocate_block_list(self, count):
+        # Blocks for a file that doesn't need to be contiguous, but reads faster when it's close together.
+        # Uses a contiguous run if there is one, otherwise the first free blocks in disk order
+        starts, lengths = self.get_free_extents()
+        if (lengths >= count).any():
+            start_block = self.allocate_blocks(count)
+            return list(range(start_block, start_block + count))
+        block_map = self.get_block_map()
+        end_of_disk = self.get_word(3, 5)
+        blocks = np.flatnonzero(~block_map[16:end_of_disk])[0:count] + 16
+        if len(blocks) < count: raise Exception("OUT OF SPACE")
+        block_map[blocks] = True
+        self.write_block_map(int(blocks[0]), int(blocks[-1]) + 1)
+        return blocks.tolist()
 
     def add_frames_to_sysdr_block(self, sysdr_block_id):
         frame_size = self.get_disk_frame_size()
         # Find next empty frames area
-        empty_entry_block = sysdr_block_id
-        empty_entry_index = 0
-        while self.get_word(empty_entry_block, empty_entry_index) != 0:
-            empty_entry_index += 1
-            if empty_entry_index >= (255-frame_size): raise Exception("We don't support HUGE directories at this time")
+        chain = self.get_index_chain(sysdr_block_id)
+        empty_entries = np.flatnonzero(self.disk_words[chain, 0:255].reshape(-1) == 0)
+        empty_entry_index = int(empty_entries[0]) if len(empty_entries) > 0 else len(chain)*255
+        # Big directories need more index blocks, linked like a random file's index
+        while empty_entry_index + frame_size > len(chain)*255:
+            new_index_block = self.allocate_blocks(1)
+            self.disk_words[new_index_block] = 0
+            previous_block = chain[-2] if len(chain) > 1 else 0
+            self.set_word(chain[-1], 255, previous_block ^ new_index_block)
+            self.set_word(new_index_block, 255, chain[-1])
+            chain.append(new_index_block)
         new_blocks_index = self.allocate_blocks(frame_size)
+        self.disk_words[new_blocks_index:new_blocks_index+frame_size] = 0
         for i in range(frame_size):
-            self.set_word(empty_entry_block, empty_entry_index + i, new_blocks_index + i)
+            self.set_sysdr_word(sysdr_block_id, empty_entry_index + i, new_blocks_index + i)
+        if sysdr_block_id in self._directories:
+            for i in range(frame_size): self._directories[sysdr_block_id].free_slots[empty_entry_index + i] = list(range(14))
         if empty_entry_index == 0:
             # ADD SYS.DR loopback
             ufd = UFD.new()
@@ -299,8 +533,14 @@ class Disk:
             ufd.set_total_byte_count(((len(self.disk_bytes)//512) - 6)//8, 'C')
             self.add_ufd(sysdr_block_id, ufd)
         else:
-            # FIXME: Update SYS.DR Size?
-            raise Exception("FIXME")
+            # Update SYS.DR size, both the loopback and the entry in the parent directory (if we know it)
+            sysdr_size = (empty_entry_index + frame_size) * 512
+            sysdr_ufds = [self.get_directory(sysdr_block_id).lookup("SYS.DR")]
+            if sysdr_block_id in self._directory_parents:
+                parent_sysdr_block_id, name = self._directory_parents[sysdr_block_id]
+                sysdr_ufds.append(self.get_directory(parent_sysdr_block_id).lookup(name))
+            for ufd in sysdr_ufds:
+                if ufd is not None: ufd.set_total_byte_count(sysdr_size)
 
     def add_file(self, sysdr_block_id, ufd, data):
         # if not attr.is_dir() and ufd.get_total_byte_count() != len(data): raise Exception("UFD datasize didn't match data")
@@ -308,6 +548,9 @@ class Disk:
         # FORCE TO DEV_DISK IF 0 OTHERWISE FILE WILL NOT EXIST
         if ufd.get_dct_link() == 0: ufd.set_dct_link(0o33)
 
+        # Check the name before allocating anything, a rejected file mustn't leave blocks marked in MAP.DR
+        if ufd.get_safe_filename() in self.get_directory(sysdr_block_id): raise Exception(f"{ufd.get_safe_filename()} already exists in this directory")
+
         # Add file (Update UFD Address as well)
         if ufd.is_dir():
             if not ufd.is_random(): raise Exception('Expected directory to be ATTR "RANDOM" as that is how they are')
@@ -315,62 +558,29 @@ class Disk:
             ufd.set_total_byte_count(self.get_disk_frame_size() * 512)
             self.add_frames_to_sysdr_block(ufd.get_address())
             self.add_ufd(sysdr_block_id, ufd)
+            self._directory_parents[ufd.get_address()] = (sysdr_block_id, ufd.get_safe_filename())
             return ufd.get_address()
         elif data is None or len(data) == 0:
             ufd.set_address(self.allocate_blocks(1))
         elif ufd.is_contiguous():
-            bytes_left = len(data)
-            data_index = 0
-            while bytes_left > 0:
-                dsk_offset = None
-                if bytes_left == len(data):
-                    ufd.set_address(self.allocate_blocks(1))
-                    dsk_offset = ufd.get_address() * 512
-                else:
-                    dsk_offset = self.allocate_blocks(1) * 512
-                if bytes_left >= 512:
-                    self.disk_bytes[dsk_offset:dsk_offset+512] = data[(data_index*512):(data_index*512)+512]
-                else:
-                    self.disk_bytes[dsk_offset:dsk_offset+bytes_left] = data[(data_index*512):(data_index*512)+bytes_left]
-                data_index += 1
-                bytes_left -= 512
+            ufd.set_address(self.allocate_blocks((len(data) + 511) // 512))
+            self.disk_bytes[ufd.get_address()*512:(ufd.get_address()*512)+len(data)] = data
         elif ufd.is_sequential():
-            bytes_left = len(data)
-            data_index = 0
-            prev_block = 0
-            next_block = self.allocate_blocks(1)
-            ufd.set_address(next_block)
-            while next_block != 0:
-                dsk_offset = next_block * 512
-                if bytes_left >= 510:
-                    self.disk_bytes[dsk_offset:dsk_offset+510] = data[data_index*510:(data_index*510)+510]
-                    next_block = self.allocate_blocks(1)
-                else:
-                    self.disk_bytes[dsk_offset:dsk_offset+bytes_left] = data[data_index*510:(data_index*510)+bytes_left]
-                    next_block = 0
-                link = prev_block ^ next_block
-                self.disk_bytes[dsk_offset+510:dsk_offset+512] = link.to_bytes(2, 'big')
-                data_index += 1
-                bytes_left -= 510
+            blocks = np.array(self.allocate_block_list((len(data) + 509) // 510))
+            ufd.set_address(int(blocks[0]))
+            self.write_blocks(blocks, data, 510)
+            # Link word is previous ^ next
+            self.disk_words[blocks, 255] = np.append(0, blocks[:-1]) ^ np.append(blocks[1:], 0)
         elif ufd.is_random():
-            rnd_block = self.allocate_blocks(1)
-            rnd_index = 0
-            bytes_left = len(data)
-            data_index = 0
-            ufd.set_address(rnd_block)
-            while bytes_left > 0:
-                data_block = self.allocate_blocks(1)
-                # Write RandomDataBlockLink
-                self.set_word(rnd_block, rnd_index, data_block)
-                rnd_index += 1
-                if rnd_index >= 255: raise Exception("Currently don't support 'RANDOM' files this large")
-                # Write Data
-                if bytes_left >= 512:
-                    self.disk_bytes[data_block*512:(data_block*512)+512] = data[(data_index*512):(data_index*512)+512]
-                else:
-                    self.disk_bytes[data_block*512:(data_block*512)+bytes_left] = data[(data_index*512):(data_index*512)+bytes_left]
-                data_index += 1
-                bytes_left -= 512
+            block_count = (len(data) + 511) // 512
+            # Files with more then 255 blocks need more index blocks
+            index_count = (block_count + 254) // 255
+            blocks = self.allocate_block_list(index_count + block_count)
+            index_blocks = blocks[0:index_count]
+            data_blocks = blocks[index_count:]
+            ufd.set_address(index_blocks[0])
+            self.set_random_index(index_blocks, data_blocks)
+            self.write_blocks(data_blocks, data)
         else: raise Exception("WHAT HAPPENED?!?!")
         
         self.add_ufd(sysdr_block_id, ufd)
@@ -378,24 +588,102 @@ class Disk:
     # Used by this class only
     def add_ufd(self, sysdr_block_id, ufd):
         # Add UFD to SYSDR
-        fib_index = ufd.get_sysdr_fib_offset(self.get_disk_frame_size())
-        fib_block = None
-        fib_block_entry_index = None
-        while fib_block_entry_index is None:
-            fib_block = self.get_word(sysdr_block_id, fib_index)
-            for entry_index in range(14):
-                testufd = UFD(self.get_block_words(fib_block)[(entry_index*18)+1:(entry_index*18)+19])
-                if not testufd.is_deleted(): continue
-                fib_block_entry_index = entry_index
-                break
-            if fib_block_entry_index is None:
-                fib_index += self.get_disk_frame_size()
-                if fib_index > 255:
-                    # FIXME: Support adding extra frames
-                    raise Exception("Currently don't support this action at this time")
+        directory = self.get_directory(sysdr_block_id)
+        name = ufd.get_safe_filename()
+        free_slot = directory.find_free_slot(ufd)
+        while free_slot is None:
+            # All the frames this UFD can go in are full, grow the directory
+            self.add_frames_to_sysdr_block(sysdr_block_id)
+            free_slot = directory.find_free_slot(ufd)
+        fib_index, fib_block_entry_index = free_slot
+        fib_block = directory.get_fib_block(fib_index)
         self.disk_bytes[(fib_block*512)+(fib_block_entry_index*36)+2:(fib_block*512)+(fib_block_entry_index*36)+38] = ufd.to_bytes('big')
+        directory.insert(name, fib_index, fib_block_entry_index)
         # Inc File Count
         self.set_word(fib_block, 0, self.get_word(fib_block, 0) + 1)
         # Update max ever count if needed
         if self.get_word(fib_block, 254) < self.get_word(fib_block, 0):
-            self.set_word(fib_block, 254, self.get_word(fib_block, 0))
\ No newline at end of file
+            self.set_word(fib_block, 254, self.get_word(fib_block, 0))
+
+    # SYS.DR words (entry block addresses) across all of its index blocks, a frame is frame_size of these
+    def get_sysdr_words(self, sysdr_block_id):
+        return self.disk_words[self.get_index_chain(sysdr_block_id), 0:255].reshape(-1)
+    def get_sysdr_word(self, sysdr_block_id, fib_index):
+        if fib_index < 255: return self.get_word(sysdr_block_id, fib_index)
+        return self.get_word(self.get_index_chain(sysdr_block_id)[fib_index // 255], fib_index % 255)
+    def set_sysdr_word(self, sysdr_block_id, fib_index, value):
+        if fib_index < 255: return self.set_word(sysdr_block_id, fib_index, value)
+        self.set_word(self.get_index_chain(sysdr_block_id)[fib_index // 255], fib_index % 255, value)
+
+    def get_directory(self, sysdr_block_id):
+        # DirectoryIndex is built the first time a SYS.DR is used, then kept in memory
+        if sysdr_block_id not in self._directories:
+            self._directories[sysdr_block_id] = DirectoryIndex(self, sysdr_block_id)
+        return self._directories[sysdr_block_id]
+
+    def lookup(self, path):
+        # Path of names from the root SYS.DR, separated by ':' (RDOS style) or '/'
+        sysdr_block_id = 6
+        names = [name for name in path.replace(':', '/').split('/') if len(name) > 0]
+        for index, name in enumerate(names):
+            name = name.upper()
+            # Names without an extension are stored with the '.'
+            if '.' not in name: name += '.'
+            ufd = self.get_directory(sysdr_block_id).lookup(name)
+            if ufd is None: return None
+            if index == len(names) - 1: return ufd
+            if not ufd.is_dir() or ufd.is_link(): return None
+            sysdr_block_id = ufd.get_address()
+        return None
+
+    def check(self):
+        # Consistency check (fsck), returns a list of problems found
+        problems = []
+        if sum(self.get_block_words(3)[0:8].tolist()) % 65536 != 0: problems.append("Disk info checksum is invalid")
+        if self.get_word(3, 6) != self.get_word(7, 17):
+            problems.append(f"Frame sizes don't match ({self.get_word(3, 6)} != {self.get_word(7, 17)})")
+        if self.get_disk_frame_size() is None: return problems + ["No frame size, can't read directories"]
+        end_of_disk = self.get_word(3, 5)
+        if end_of_disk > len(self.disk_words): problems.append(f"Disk info says {end_of_disk} blocks, image only has {len(self.disk_words)}")
+
+        # Which file (index into owner_paths) uses each block
+        owners = np.full(len(self.disk_words), -1)
+        owner_paths = []
+        def use_blocks(blocks, path):
+            blocks = np.array(blocks, dtype=int)
+            if ((blocks < 0) | (blocks >= len(self.disk_words))).any():
+                problems.append(f"{path}: Uses blocks outside the disk")
+                blocks = blocks[(blocks >= 0) & (blocks < len(self.disk_words))]
+            for block in np.unique(blocks[owners[blocks] >= 0]).tolist():
+                problems.append(f"{path}: Block {block} is also used by {owner_paths[owners[block]]}")
+            owners[blocks] = len(owner_paths)
+            owner_paths.append(path)
+        def check_directory(sysdr_block_id, prefix):
+            try:
+                table = self.get_directory_table(sysdr_block_id)
+            except Exception as ex:
+                problems.append(f"{prefix or 'SYS.DR'}: {ex}")
+                return
+            for ufd, name in zip(table, table.names.tolist()):
+                path = prefix + name
+                if ufd.get_address() == sysdr_block_id: continue # SYS.DR loopback
+                try:
+                    use_blocks(self.get_file_blocks(ufd), path)
+                except Exception as ex:
+                    problems.append(f"{path}: {ex}")
+                    continue
+                if ufd.is_dir() and not ufd.is_link() and ufd.get_address() not in checked_directories:
+                    checked_directories.add(ufd.get_address())
+                    check_directory(ufd.get_address(), path + "/")
+        checked_directories = {6}
+        use_blocks(self.get_directory_blocks(6), "SYS.DR")
+        use_blocks(range(15, 15 + self.get_map_block_count()), "MAP.DR")
+        check_directory(6, "")
+
+        block_map = self.get_block_map()
+        blocks = np.arange(16, min(end_of_disk, len(self.disk_words)))
+        for block in blocks[(owners[blocks] >= 0) & ~block_map[blocks]].tolist():
+            problems.append(f"{owner_paths[owners[block]]}: Block {block} is marked free in MAP.DR")
+        lost_blocks = blocks[(owners[blocks] < 0) & block_map[blocks]]
+        if len(lost_blocks) > 0: problems.append(f"{len(lost_blocks)} blocks are marked in use in MAP.DR but not used by anything")
+        return problems
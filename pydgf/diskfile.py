@@ -0,0 +1,59 @@
+import io
+
+class DiskFile(io.RawIOBase):
+    # Read only, seekable file object for a file on a Disk (See Disk.open), blocks are read as they're needed
+    def __init__(self, disk, ufd):
+        super().__init__()
+        attr = ufd.get_file_attributes()
+        if attr.is_dir() or attr.is_link() or ufd.get_address() < 16: raise Exception("UFD doesn't have any file data to read")
+        self.disk = disk
+        self.ufd = ufd.copy()
+        self.attr = attr
+        # Sequential blocks use their last word to link to the next block
+        self.block_size = 510 if attr.is_sequential() else 512
+        self.size = ufd.get_total_byte_count()
+        self.position = 0
+        # Sequential block addresses walked so far, so seeking back doesn't need to walk from the start again
+        self._chain = [ufd.get_address()]
+        # Random file block addresses, read from the index blocks on first use
+        self._index = None
+
+    def readable(self): return True
+    def seekable(self): return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if self.closed: raise ValueError("I/O operation on closed file")
+        match whence:
+            case io.SEEK_SET: position = offset
+            case io.SEEK_CUR: position = self.position + offset
+            case io.SEEK_END: position = self.size + offset
+            case _: raise ValueError(f"Invalid whence ({whence})")
+        if position < 0: raise ValueError(f"Negative seek position {position}")
+        self.position = position
+        return position
+
+    def get_block_address(self, index):
+        address = self.ufd.get_address()
+        if self.attr.is_contiguous(): return address + index
+        if self.attr.is_random():
+            if self._index is None: self._index = self.disk.get_random_block_addresses(address, self.ufd.get_logical_block_count()+1)
+            return int(self._index[index])
+        # Sequential, walk the XOR links until we get to the block
+        while len(self._chain) <= index:
+            previous_address = self._chain[-2] if len(self._chain) > 1 else 0
+            self._chain.append(previous_address ^ self.disk.get_word(self._chain[-1], 255))
+        return self._chain[index]
+
+    def readinto(self, buffer):
+        if self.closed: raise ValueError("I/O operation on closed file")
+        buffer = memoryview(buffer).cast('B')
+        total = 0
+        while total < len(buffer) and self.position < self.size:
+            index, offset = divmod(self.position, self.block_size)
+            block = self.get_block_address(index)
+            if block >= len(self.disk.disk_words): raise Exception("Tried to read outside the disk!")
+            length = min(len(buffer) - total, self.block_size - offset, self.size - self.position)
+            buffer[total:total+length] = self.disk.disk_bytes[(block*512)+offset:(block*512)+offset+length]
+            self.position += length
+            total += length
+        return total
@@ -1,9 +1,13 @@
 import os
 import pickle
 import re
+import sys
+import threading
+import time
 import gi
+import numpy as np
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk, Pango, GObject
+from gi.repository import Gtk, Gdk, Pango, GObject, GLib
 
 # https://stackoverflow.com/questions/5977576/is-there-a-convenient-way-to-map-a-file-uri-to-os-path
 try:
@@ -17,14 +21,17 @@ def uri_to_path(uri):
     host = "{0}{0}{mnt}{0}".format(os.path.sep, mnt=parsed.netloc)
     return os.path.normpath(os.path.join(host, url2pathname(unquote(parsed.path))))
 
-from .disk import Disk
+from .disk import Disk, swab, DISK_TYPES, plan_blocks, get_data_block_count, get_file_block_count, get_frames_block_count, get_map_dr_block_count, get_name_fib_offset
 from .ufd import UFD
 from .hexview import Hexview
-from .attributes import Attributes, CellRendererAttributes
-from .magtape import Magtape
-from .dumpfile import Dumpfile
+from .attributes import Attributes
+from .cellattributes import CellRendererAttributes
+from .magtape import write_tape
+from .filecache import FileCache, resolve_data, replace_file
+from .cli import walk_image, walk_dsk
 
 # Tree Model Indexes
+# NOTE: MOD_DATA can hold bytes or a LazyFileData, use resolve_data() when the real bytes are needed
 MOD_NAME = 0
 MOD_ATTR = 1
 MOD_LINK_ATTR = 2
@@ -32,6 +39,11 @@ MOD_DATA = 3
 MOD_DCTLINK = 4
 MOD_MODIFIED = 5
 MOD_ACCESSED = 6
+# Hidden, kept up to date from the row signals (see on_row_inserted/on_row_changed/on_row_deleted)
+MOD_USAGE = 7 # Blocks the row uses by itself (a directory's SYS.DR depends on what's in it)
+MOD_SUBTREE_USAGE = 8 # Blocks the row and everything under it use
+MOD_FIB_OFFSET = 9 # SYS.DR hash of the name in its parent directory (-1 for rows that aren't saved, "[...]")
+MOD_NAME_COUNTS = 10 # Directories: names in each SYS.DR hash (see new_name_counts), None for files
 
 # Device Codes
 DEV_SECONDARY_MASK = 0o40
@@ -147,6 +159,7 @@ class DskWindow(Gtk.ApplicationWindow):
         tb_save = Gtk.ToolButton(label="Save As", icon_name="document-save-as", tooltip_text="Save As")
         tb_save.connect("clicked", self.on_saveas_clicked)
         toolbar.insert(tb_save, -1)
+        self.save_button = tb_save
 
         self.frame_size_control = Gtk.SpinButton(
             adjustment = Gtk.Adjustment(value=5, lower=1, upper=255, step_increment=1, page_increment=10, page_size=0), 
@@ -172,15 +185,36 @@ class DskWindow(Gtk.ApplicationWindow):
         tb_dsk_progress_4048.add(self.dsk_progress_4048)
         toolbar.insert(tb_dsk_progress_4048, -1)
 
+        # Shown while an image loads in the background (see populate_store_with_file)
+        self.load_box = Gtk.HBox()
+        self.load_progress = Gtk.ProgressBar(show_text=True)
+        self.load_box.pack_start(self.load_progress, True, True, 0)
+        load_cancel = Gtk.Button(label="Cancel")
+        load_cancel.connect("clicked", self.on_load_cancel_clicked)
+        self.load_box.pack_start(load_cancel, False, False, 0)
+        self.load_progress.show()
+        load_cancel.show()
+        self.load_box.set_no_show_all(True)
+        # threading.Event of the load running, set it to stop the load
+        self.load_cancel = None
+        self.connect("destroy", self.on_destroy)
+
         vbox.pack_start(toolbar, False, False, 0)
         vbox.pack_start(hbox, True, True, 0)
+        vbox.pack_start(self.load_box, False, False, 0)
         
-        # MOD_NAME, MOD_ATTR, MOD_LINK_ATTR, MOD_DATA, MOD_DCTLINK, MOD_MODIFIED, MOD_ACCESSED
-        model = Gtk.TreeStore(str, str, str, object, int, str, str)
-        model.connect('row-changed', self.on_row_changed)
-        model.connect('row-inserted', self.on_row_inserted)
-        model.connect('row-deleted', self.on_row_deleted)
+        # MOD_NAME, MOD_ATTR, MOD_LINK_ATTR, MOD_DATA, MOD_DCTLINK, MOD_MODIFIED, MOD_ACCESSED, MOD_USAGE, MOD_SUBTREE_USAGE, MOD_FIB_OFFSET, MOD_NAME_COUNTS
+        model = Gtk.TreeStore(str, str, str, object, int, str, str, int, int, int, object)
+        # Blocks used by all the top level rows (sum of their MOD_SUBTREE_USAGE), and by the root SYS.DR frames
+        self.usage = 0
+        self.root_usage = 0
+        # MOD_NAME_COUNTS of the root directory
+        self.root_name_counts = self.new_name_counts()
+        self.row_changed_handler = model.connect('row-changed', self.on_row_changed)
+        self.row_inserted_handler = model.connect('row-inserted', self.on_row_inserted)
+        self.row_deleted_handler = model.connect('row-deleted', self.on_row_deleted)
         self.model = model # FOR SAVE ABILITY
+        self.file_cache = FileCache()
         treeview = Gtk.TreeView(model=model)
         self.treeview = treeview # FIXME: FOR CONTEXT MENU REASONS
         treeview.connect('key-press-event', self.on_treeview_keypress)
@@ -248,6 +282,7 @@ class DskWindow(Gtk.ApplicationWindow):
         hbox.pack_start(fileview, False, False, 0)
 
         if filepath is not None: self.populate_store_with_file(model, filepath, fmt)
+        else: self.recalculate_usage(model)
         
         treeview.expand_all()
         treeview.columns_autosize()
@@ -259,14 +294,13 @@ class DskWindow(Gtk.ApplicationWindow):
 
         self.dsk_progress_6030.set_show_text(True)
         self.dsk_progress_4048.set_show_text(True)
-        self.update_dsk_progress()
 
         self.add(vbox)
         self.set_default_size(1260, 700)
         self.show_all()
 
     def populate_store_with_file(self, store, filepath, fmt = None):
-        test = Attributes.from_string("AC")
+        # The disk info/special blocks are read here, the files are read by a worker thread and added as they come in (see load_records)
         if fmt is None:
             match filepath.split(".")[-1:][0].lower():
                 case "dsk" | "img": fmt = "dsk"
@@ -274,12 +308,7 @@ class DskWindow(Gtk.ApplicationWindow):
                 case "dp": fmt = "dp"
         match fmt:
             case "dsk":
-                disk_bytes = None
-                with open(filepath, 'rb') as file:
-                    disk_bytes = file.read()
-                    if len(disk_bytes) % 512 != 0:
-                        raise Exception("Unexpected disk length")
-                dsk = Disk(disk_bytes)
+                dsk = Disk(filepath, writable=False)
                 # Add special files
                 boot_sector_data = dsk.disk_bytes[0:1024].tobytes()
                 if len(boot_sector_data.replace(b'\x00', b'').replace(b'\xFF', b'')) > 0:
@@ -297,104 +326,105 @@ class DskWindow(Gtk.ApplicationWindow):
                         })
                 
                 # Attempt to setup frame_size
-                diskinfo_frame_size = dsk.get_block_words(3)[6]
-                other_frame_size = dsk.get_block_words(7)[17]
+                diskinfo_frame_size = dsk.get_word(3, 6)
+                other_frame_size = dsk.get_word(7, 17)
                 if diskinfo_frame_size != 0:
                     if diskinfo_frame_size != other_frame_size:
-                        print(f"WARNING: dsk frame_size(s) don't match! Using first one {diskinfo_frame_size} != {other_frame_size}")
+                        print(f"WARNING: dsk frame_size(s) don't match! Using first one {diskinfo_frame_size} != {other_frame_size}", file=sys.stderr)
                     self.frame_size_control.set_value(diskinfo_frame_size)
                 elif other_frame_size != 0:
-                    print(f"WARNING: dsk info frame_size is zero?!?")
+                    print(f"WARNING: dsk info frame_size is zero?!?", file=sys.stderr)
                     self.frame_size_control.set_value(other_frame_size)
                 else:
-                    print(f"WARNING: dsk frame_size(s) are zero?!? Using 5.")
+                    print(f"WARNING: dsk frame_size(s) are zero?!? Using 5.", file=sys.stderr)
                     self.frame_size_control.set_value(5)
                 
-                # Add filesystem from "SYS.DR"
-                self.populate_store_with_dsk(store, dsk)
-            case "9trk":
-                with open(filepath, 'rb') as file:
-                    self.populate_store_with_9trk(store, Magtape(file.read()))
-            case "dp":
-                with open(filepath, 'rb') as file:
-                    self.populate_store_with_dp(store, file.read())
+                self.start_loading(store, walk_dsk(dsk, file_cache=self.file_cache))
+            case "9trk" | "dp":
+                self.start_loading(store, walk_image(filepath, fmt))
             case _:
-                print("WARNING: DIDNT LOAD FILE")
-
-    def populate_store_with_9trk(self, store, magtape):
-        for tape_id, tape_data in magtape.files.items():
-            treeiter = self.append_to_model(store, None, {
-                MOD_NAME: f"FILE{tape_id:02}",
-                MOD_DATA: tape_data,
-            })
-            if tape_data[0] == 0xFF:
-                # When this happens, it appears to be a DUMP file
-                try:
-                    df = Dumpfile(tape_data)
-                    df_files = df.get_files()
-                    treeiter = self.append_to_model(store, None, {
-                        MOD_NAME: f"DUMPFILE{tape_id:02}.DR",
-                        MOD_ATTR: "YD",
-                    })
-                    for ufd, data in df_files:
-                        self.append_to_model(store, treeiter, {
-                                MOD_NAME: ufd.get_safe_filename(),
-                                MOD_ATTR: f"{ufd.get_file_attributes()}",
-                                MOD_MODIFIED: f"{ufd.get_modified_datetime():%x %H:%M}",
-                                MOD_ACCESSED: f"{ufd.get_accessed_datetime():%x}",
-                                MOD_DATA: data,
-                                MOD_DCTLINK: ufd.get_dct_link(),
-                                MOD_LINK_ATTR: f"{ufd.get_link_attributes()}",
-                        })
-                except Exception as ex:
-                    print(f"WARNING: Dumpfile decoding failed, was it really a dump? 9TKFILE {tape_id}: {ex}")
-        pass
-
-    def populate_store_with_dsk(self, store, dsk, directory=6, node=None):
-        address = directory
-        block_words = dsk.get_block_words(address)
-        for i in range(256):
-            if block_words[i] > 0:
-                deb = dsk.get_block_words(block_words[i])
-                entries = deb[0]
-                if entries > 14: raise Exception("Unexpected number of entries")
-                for e in range(entries):
-                    ufd_start = (e*18)+1
-                    ufd_end = ((e+1)*18)+1
-                    ufd = UFD(deb[ufd_start:ufd_end])
-                    if ufd.is_deleted(): continue
-                    if ufd.get_safe_filename() == "SYS.DR": continue
-                    if ufd.get_safe_filename() == "MAP.DR": continue
-                    # Skip showing "SYSTEM" files like "Device links"
-                    # if ufd.get_safe_filename()[0] == '$': continue
-                    if (ufd.is_file() or ufd.is_dir()) and not ufd.is_link():
-                        data = dsk.get_file_bytes(ufd)
-                        treeiter = self.append_to_model(store, node, {
-                                MOD_NAME : ufd.get_safe_filename(),
-                                MOD_ATTR : f"{ufd.get_file_attributes()}",
-                                MOD_MODIFIED : f"{ufd.get_modified_datetime():%x %H:%M}",
-                                MOD_ACCESSED : f"{ufd.get_accessed_datetime():%x}",
-                                MOD_DATA : data,
-                                MOD_DCTLINK : ufd.get_dct_link(),
-                                MOD_LINK_ATTR: f"{ufd.get_link_attributes()}",
-                            })
-                    # Prevent Recursion (ufd.get_address() != address)
-                    if ufd.is_dir() and not ufd.is_link() and ufd.get_address() != address:
-                        self.populate_store_with_dsk(store, dsk, ufd.get_address(), treeiter)
-
-    def populate_store_with_dp(self, store, data_bytes):
-        df = Dumpfile(data_bytes)
-        files = df.get_files(True)
-        for ufd, data in files:
-            _ = self.append_to_model(store, None, {
-                    MOD_NAME: ufd.get_safe_filename(),
-                    MOD_ATTR: f"{ufd.get_file_attributes()}",
-                    MOD_MODIFIED: f"{ufd.get_modified_datetime():%x %H:%M}",
-                    MOD_ACCESSED: f"{ufd.get_accessed_datetime():%x}",
-                    MOD_DATA: data,
-                    MOD_DCTLINK: ufd.get_dct_link(),
+                print("WARNING: DIDNT LOAD FILE", file=sys.stderr)
+                self.recalculate_usage(store)
+
+    def start_loading(self, store, records):
+        # Usage is worked out once everything is in (see finish_loading)
+        self.start_bulk_update(store)
+        self.load_cancel = threading.Event()
+        # path -> directory row, rows aren't moved or removed while loading (see on_drag_data_received/on_delete/on_new_folder)
+        self.load_parents = {}
+        self.load_count = 0
+        self.load_progress.set_text("Loading...")
+        self.load_box.show()
+        self.save_button.set_sensitive(False)
+        threading.Thread(target=self.load_records, args=(records, self.load_cancel), daemon=True).start()
+
+    def load_records(self, records, cancel):
+        # Worker thread: records are (path, ufd, data) like cli.walk_image, they're handed to the UI thread in batches.
+        # Nothing in here may touch Gtk
+        batch = []
+        sent = time.monotonic()
+        try:
+            for record in records:
+                if cancel.is_set(): return
+                batch.append(record)
+                if len(batch) >= 256 or time.monotonic() - sent > 0.1:
+                    GLib.idle_add(self.on_load_batch, cancel, batch)
+                    batch = []
+                    sent = time.monotonic()
+        except Exception as ex:
+            GLib.idle_add(self.on_load_batch, cancel, batch)
+            GLib.idle_add(self.on_load_done, cancel, ex)
+            return
+        GLib.idle_add(self.on_load_batch, cancel, batch)
+        GLib.idle_add(self.on_load_done, cancel, None)
+
+    def on_load_batch(self, cancel, batch):
+        if cancel.is_set(): return False
+        for path, ufd, data in batch:
+            parent, _, name = path.rpartition("/")
+            treeiter = self.append_to_model(self.model, self.load_parents.get(parent), {
+                    MOD_NAME : name,
+                    MOD_ATTR : f"{ufd.get_file_attributes()}",
+                    MOD_MODIFIED : f"{ufd.get_modified_datetime():%x %H:%M}",
+                    MOD_ACCESSED : f"{ufd.get_accessed_datetime():%x}",
+                    MOD_DATA : data,
+                    MOD_DCTLINK : ufd.get_dct_link(),
                     MOD_LINK_ATTR: f"{ufd.get_link_attributes()}",
                 })
+            if ufd.is_dir(): self.load_parents[path] = treeiter
+        self.load_count += len(batch)
+        self.load_progress.pulse()
+        self.load_progress.set_text(f"Loading... {self.load_count} files")
+        return False
+
+    def on_load_done(self, cancel, ex):
+        if cancel.is_set(): return False
+        self.finish_loading()
+        if ex is not None:
+            print(f"Load Failed: {ex}", file=sys.stderr)
+            msgbox = Gtk.MessageDialog(message_type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.OK, text=f"Load Failed:\n\n{ex}")
+            msgbox.run()
+            msgbox.destroy()
+        return False
+
+    def on_destroy(self, *args):
+        # Stop loading, nothing is left to add the rows to
+        if self.load_cancel is not None: self.load_cancel.set()
+
+    def on_load_cancel_clicked(self, *args):
+        # What's been loaded so far stays
+        if self.load_cancel is None: return
+        self.load_cancel.set()
+        self.finish_loading()
+
+    def finish_loading(self):
+        self.load_cancel = None
+        self.load_parents = {}
+        self.load_box.hide()
+        self.save_button.set_sensitive(True)
+        self.end_bulk_update(self.model)
+        self.treeview.expand_all()
+        self.treeview.columns_autosize()
 
     def on_new_clicked(self, widget): self.get_application().add_window(DskWindow())
 
@@ -452,7 +482,7 @@ class DskWindow(Gtk.ApplicationWindow):
         
         add_filter("6030 DSK", ["*.dsk", "*.DSK", "*.img", "*.IMG"])
         add_filter("4048 DSK", ["*.dsk", "*.DSK", "*.img", "*.IMG"])
-        # add_filter("9TRK files", ["*.9trk", "*.9TRK"]) # 6026
+        add_filter("9TRK files", ["*.9trk", "*.9TRK"]) # 6026
         # add_filter("DumP files", ["*.dp", "*.DP"])
 
         filename = None
@@ -468,11 +498,13 @@ class DskWindow(Gtk.ApplicationWindow):
                     case "6030 DSK":
                         new_dsk = self.new_dsk_from_model(self.model, "6030")
                         new_dsk_bytes = new_dsk.disk_bytes.tobytes()
-                        with open(filename, 'wb') as file: file.write(new_dsk_bytes)
+                        with replace_file(filename) as file: file.write(new_dsk_bytes)
                     case "4048 DSK":
                         new_dsk = self.new_dsk_from_model(self.model, "4048")
                         new_dsk_bytes = new_dsk.disk_bytes.tobytes()
-                        with open(filename, 'wb') as file: file.write(new_dsk_bytes)
+                        with replace_file(filename) as file: file.write(new_dsk_bytes)
+                    case "9TRK files":
+                        write_tape(filename, self.iter_tape_files(self.model))
                     case _:
                         raise Exception("WHAT!?!")
                 print(f"File Saved: {filename}")
@@ -486,10 +518,21 @@ class DskWindow(Gtk.ApplicationWindow):
 
         return True
     
+    def iter_tape_files(self, model):
+        # Top level files become the tape files (in order), directories (like the DUMPFILEnn.DR of a loaded tape) are skipped
+        treeiter = model.get_iter_first()
+        while treeiter is not None:
+            model_data = model[treeiter][:]
+            if model_data[MOD_NAME][0:1] == '[' or Attributes.from_string(model_data[MOD_ATTR]).is_dir():
+                print(f"WARNING: {model_data[MOD_NAME]} is not saved to the tape", file=sys.stderr)
+            else:
+                yield resolve_data(model_data[MOD_DATA]) or b''
+            treeiter = model.iter_next(treeiter)
+
     def on_tree_selection_changed(self, widget):
         model, treeiter = widget.get_selected()
         if treeiter is not None:
-            self.fileview.set_data(model[treeiter][MOD_DATA])
+            self.fileview.set_data(resolve_data(model[treeiter][MOD_DATA]))
 
     def on_drag_data_get(self, widget, drag_context, data, info, time):
         model, treeiter = widget.get_selection().get_selected()
@@ -523,6 +566,8 @@ class DskWindow(Gtk.ApplicationWindow):
                 pass
 
     def on_drag_data_received(self, widget, drag_context, x, y, data, info, time):
+        # The loader keeps the directory rows it adds to (load_parents), they can't move/go away until it's done
+        if self.load_cancel is not None: return Gtk.drag_finish(drag_context, False, False, time)
         def add_uri_file(uri, model, parent):
             path = uri_to_path(uri)
             data = None
@@ -548,10 +593,13 @@ class DskWindow(Gtk.ApplicationWindow):
                         parent = model.iter_parent(parent)
                         if parent is None: break;
                         attr = Attributes.from_string(model[parent][:][MOD_ATTR])
-                for uri in data.get_uris():
-                    # FIXME!!! Check if uri is directory
-                    add_uri_file(uri, model, parent)
-                self.update_dsk_progress()
+                self.start_bulk_update(model)
+                try:
+                    for uri in data.get_uris():
+                        # FIXME!!! Check if uri is directory
+                        add_uri_file(uri, model, parent)
+                finally:
+                    self.end_bulk_update(model)
                 return Gtk.drag_finish(drag_context, True, False, time)
             case 42069: # SAME_WIDGET
                 model, treeiter = widget.get_selection().get_selected()
@@ -590,10 +638,14 @@ class DskWindow(Gtk.ApplicationWindow):
                     next_iter = model.append(iter, rt_data)
                     for next_tuple in result_tuple[1]:
                         load_drop_nodes(next_iter, next_tuple)
-                load_drop_nodes(parent, get_with_children(treeiter))
-
-                self.update_dsk_progress()
-                return Gtk.drag_finish(drag_context, True, True, time)
+                # The moved rows are removed here (not by the treeview after the drop), so it's all one bulk update
+                self.start_bulk_update(model)
+                try:
+                    load_drop_nodes(parent, get_with_children(treeiter))
+                    self.remove_row(model, treeiter)
+                finally:
+                    self.end_bulk_update(model)
+                return Gtk.drag_finish(drag_context, True, False, time)
             case 69420: # OTHER_WIDGET
                 result = pickle.loads(data.get_data())
                 model = widget.get_model()
@@ -615,17 +667,68 @@ class DskWindow(Gtk.ApplicationWindow):
                     for next_tuple in result_tuple[1]:
                         load_drop_nodes(next_iter, next_tuple)
 
-                load_drop_nodes(parent, result)
-                self.update_dsk_progress()
+                self.start_bulk_update(model)
+                try:
+                    load_drop_nodes(parent, result)
+                finally:
+                    self.end_bulk_update(model)
                 return Gtk.drag_finish(drag_context, True, False, time)
 
     def on_row_changed(self, model, path, iter):
+        # The name might have changed, move it to its new hash in the parent's counts
+        fib_offset = self.get_row_fib_offset(model, iter)
+        old_fib_offset = model.get_value(iter, MOD_FIB_OFFSET)
+        if fib_offset != old_fib_offset:
+            name_counts = self.get_name_counts(model, model.iter_parent(iter))
+            name_counts[old_fib_offset] -= 1
+            name_counts[fib_offset] += 1
+            self.set_usage_value(model, iter, MOD_FIB_OFFSET, fib_offset)
+        # Or it's a directory now
+        if self.is_dir_row(model, iter) and model.get_value(iter, MOD_NAME_COUNTS) is None:
+            self.set_usage_value(model, iter, MOD_NAME_COUNTS, self.new_name_counts())
+        self.update_row_usage(model, iter)
+        self.update_parent_usage(model, iter)
         self.update_dsk_progress()
 
     def on_row_inserted(self, model, path, iter):
+        # New rows don't have children yet (rows dragged from other windows still have their old usage values and counts)
+        fib_offset = self.get_row_fib_offset(model, iter)
+        self.set_usage_value(model, iter, MOD_FIB_OFFSET, fib_offset)
+        self.set_usage_value(model, iter, MOD_NAME_COUNTS, self.new_name_counts() if self.is_dir_row(model, iter) else None)
+        self.get_name_counts(model, model.iter_parent(iter))[fib_offset] += 1
+        usage = self.get_row_usage(model, iter)
+        self.set_usage_value(model, iter, MOD_USAGE, usage)
+        self.set_usage_value(model, iter, MOD_SUBTREE_USAGE, 0)
+        self.add_usage(model, iter, usage)
+        self.update_parent_usage(model, iter)
         self.update_dsk_progress()
 
+    def remove_row(self, model, treeiter):
+        # Take the row's name and blocks out before it's removed, on_row_deleted only sees what's left
+        parent = model.iter_parent(treeiter)
+        self.get_name_counts(model, parent)[model.get_value(treeiter, MOD_FIB_OFFSET)] -= 1
+        self.add_usage(model, parent, -model.get_value(treeiter, MOD_SUBTREE_USAGE))
+        model.remove(treeiter)
+
     def on_row_deleted(self, model, path):
+        parent_path = path.copy()
+        parent = model.get_iter(parent_path) if parent_path.get_depth() > 1 and parent_path.up() else None
+        name_counts = self.get_name_counts(model, parent)
+        if int(name_counts.sum()) != 2 + model.iter_n_children(parent):
+            # Removed without remove_row, count the parent again from what's left
+            name_counts[:] = self.new_name_counts()
+            child_iter = model.iter_children(parent)
+            while child_iter is not None:
+                name_counts[model.get_value(child_iter, MOD_FIB_OFFSET)] += 1
+                child_iter = model.iter_next(child_iter)
+            if parent is None:
+                self.usage = self.get_children_usage(model, None)
+            else:
+                usage = model.get_value(parent, MOD_USAGE) + self.get_children_usage(model, parent)
+                self.add_usage(model, parent, usage - model.get_value(parent, MOD_SUBTREE_USAGE))
+        # Its SYS.DR might need less frames now
+        if parent is None: self.root_usage = self.get_directory_usage(model, None)
+        else: self.update_row_usage(model, parent)
         self.update_dsk_progress()
 
     def on_treeview_keypress(self, widget, event):
@@ -651,6 +754,7 @@ class DskWindow(Gtk.ApplicationWindow):
             return True
 
     def on_new_folder(self, *args):
+        if self.load_cancel is not None: return
         model, treeiter = self.treeview.get_selection().get_selected()
         while treeiter is not None:
             if Attributes.from_string(model[treeiter][:][MOD_ATTR]).is_dir():
@@ -663,19 +767,16 @@ class DskWindow(Gtk.ApplicationWindow):
         self.treeview.set_cursor(model.get_path(treeiter))
     
     def on_delete(self, *args):
+        if self.load_cancel is not None: return
         model, treeiter = self.treeview.get_selection().get_selected()
         if treeiter is not None:
-            model.remove(treeiter)
+            self.remove_row(model, treeiter)
             self.update_dsk_progress()
 
     def on_swab(self, *args):
         model, treeiter = self.treeview.get_selection().get_selected()
         if treeiter is not None:
-            data = bytearray(model[treeiter][MOD_DATA])
-            for i in range(len(data) // 2):
-                tmp = data[i*2+0]
-                data[i*2+0] = data[i*2+1]
-                data[i*2+1] = tmp
+            data = swab(resolve_data(model[treeiter][MOD_DATA]))
             model[treeiter][MOD_DATA] = data
             self.fileview.set_data(data)
             self.update_dsk_progress()
@@ -697,107 +798,146 @@ class DskWindow(Gtk.ApplicationWindow):
         self.model[path][MOD_DCTLINK] = int(new_text, base=0)
 
     def on_framesize_changed(self, widget):
-        self.update_dsk_progress()
-
-    def update_dsk_progress(self):
+        # Every directory's usage changes
+        self.recalculate_usage(self.model)
+
+    def get_row_usage(self, model, treeiter):
+        # Same counts as disk.plan_blocks
+        name, attr, data = model.get(treeiter, MOD_NAME, MOD_ATTR, MOD_DATA)
+        if len(name) > 0 and name[0] == '[': return 0 # Skip "Reserved" pygdf file(s)
+        attributes = Attributes.from_string(attr)
+        if attributes.is_dir(): return 1 + self.get_directory_usage(model, treeiter)
+        return get_file_block_count(attributes, len(data) if data is not None else 0)
+
+    def get_directory_usage(self, model, treeiter):
+        # SYS.DR frames (and extra index blocks) of a directory row (None for the root), only the hash with the most names matters
+        return get_frames_block_count(int(self.get_name_counts(model, treeiter)[:-1].max()), int(self.frame_size_control.get_value()))
+
+    def is_dir_row(self, model, treeiter):
+        return Attributes.from_string(model.get_value(treeiter, MOD_ATTR)).is_dir()
+
+    def get_row_fib_offset(self, model, treeiter):
+        name = model.get_value(treeiter, MOD_NAME)
+        if name[0:1] == '[': return -1
+        return get_name_fib_offset(name, int(self.frame_size_control.get_value()))
+
+    def new_name_counts(self):
+        # Names in each SYS.DR hash of an empty directory (SYS.DR and MAP.DR are always there).
+        # The extra last slot counts the rows that aren't saved (MOD_FIB_OFFSET -1), so the counts add up to the number of children + 2
         frame_size = int(self.frame_size_control.get_value())
-        dsk_progress_value = frame_size + 1
-        
-        def calculate(model, path, treeiter):
-            nonlocal dsk_progress_value
-            if len(model[treeiter][:][MOD_NAME]) > 0 and model[treeiter][:][MOD_NAME][0] == '[':
-                return False # Skip "Reserved" pygdf file(s)
-            if Attributes.from_string(model[treeiter][:][MOD_ATTR]).is_dir():
-                dsk_progress_value += frame_size + 1
-            else:
-                data_size = len(model[treeiter][:][MOD_DATA]) if model[treeiter][:][MOD_DATA] is not None else 0
-                dsk_progress_value += (data_size // 512)
-            return False
-        self.model.foreach(calculate)
+        name_counts = np.zeros(frame_size + 1, dtype=np.int64)
+        for name in ["SYS.DR", "MAP.DR"]: name_counts[get_name_fib_offset(name, frame_size)] += 1
+        return name_counts
+
+    def get_name_counts(self, model, treeiter):
+        # MOD_NAME_COUNTS of a directory row (None for the root)
+        if treeiter is None: return self.root_name_counts
+        return model.get_value(treeiter, MOD_NAME_COUNTS)
+
+    def update_row_usage(self, model, treeiter):
+        usage = self.get_row_usage(model, treeiter)
+        delta = usage - model.get_value(treeiter, MOD_USAGE)
+        if delta == 0: return
+        self.set_usage_value(model, treeiter, MOD_USAGE, usage)
+        self.add_usage(model, treeiter, delta)
+
+    def update_parent_usage(self, model, treeiter):
+        # What's in the parent directory changed, its SYS.DR might need more (or less) frames
+        parent = model.iter_parent(treeiter)
+        if parent is None: self.root_usage = self.get_directory_usage(model, None)
+        else: self.update_row_usage(model, parent)
+
+    def get_children_usage(self, model, treeiter):
+        usage = 0
+        child_iter = model.iter_children(treeiter)
+        while child_iter is not None:
+            usage += model.get_value(child_iter, MOD_SUBTREE_USAGE)
+            child_iter = model.iter_next(child_iter)
+        return usage
+
+    def set_usage_value(self, model, treeiter, column, value):
+        # Usage columns changing isn't a change on_row_changed cares about
+        model.handler_block(self.row_changed_handler)
+        model.set_value(treeiter, column, value)
+        model.handler_unblock(self.row_changed_handler)
+
+    def add_usage(self, model, treeiter, delta):
+        # delta blocks added to (or removed from) treeiter's subtree, and everything above it
+        if delta == 0: return
+        while treeiter is not None:
+            self.set_usage_value(model, treeiter, MOD_SUBTREE_USAGE, model.get_value(treeiter, MOD_SUBTREE_USAGE) + delta)
+            treeiter = model.iter_parent(treeiter)
+        self.usage += delta
+
+    def recalculate_usage(self, model):
+        # Usage and name counts of every row from scratch
+        def calculate(parent):
+            # Returns the usage of everything under parent, and its name counts
+            total = 0
+            name_counts = self.new_name_counts()
+            treeiter = model.iter_children(parent)
+            while treeiter is not None:
+                fib_offset = self.get_row_fib_offset(model, treeiter)
+                name_counts[fib_offset] += 1
+                self.set_usage_value(model, treeiter, MOD_FIB_OFFSET, fib_offset)
+                children_usage, children_name_counts = calculate(treeiter)
+                self.set_usage_value(model, treeiter, MOD_NAME_COUNTS, children_name_counts if self.is_dir_row(model, treeiter) else None)
+                usage = self.get_row_usage(model, treeiter)
+                self.set_usage_value(model, treeiter, MOD_USAGE, usage)
+                self.set_usage_value(model, treeiter, MOD_SUBTREE_USAGE, usage + children_usage)
+                total += usage + children_usage
+                treeiter = model.iter_next(treeiter)
+            return total, name_counts
+        self.usage, self.root_name_counts = calculate(None)
+        self.root_usage = self.get_directory_usage(model, None)
+        self.update_dsk_progress()
 
-        fraction_6030 = dsk_progress_value / (616-16)
-        self.dsk_progress_6030.set_fraction(fraction_6030)
-        self.dsk_progress_6030.set_text(f"6030 Disk Usage\nEstimate: ({dsk_progress_value}/{616-16})\n{fraction_6030:.0%}")
+    # Row signals are ignored while lots of rows are added (loading an image), usage is worked out once at the end
+    def start_bulk_update(self, model):
+        for handler in [self.row_changed_handler, self.row_inserted_handler, self.row_deleted_handler]: model.handler_block(handler)
+    def end_bulk_update(self, model):
+        for handler in [self.row_changed_handler, self.row_inserted_handler, self.row_deleted_handler]: model.handler_unblock(handler)
+        self.recalculate_usage(model)
 
-        fraction_4048 = dsk_progress_value / (12180-17)
-        self.dsk_progress_4048.set_fraction(fraction_4048)
-        self.dsk_progress_4048.set_text(f"4048 Disk Usage\nEstimate: ({dsk_progress_value}/{12180-17})\n{fraction_4048:.0%}")
+    def update_dsk_progress(self):
+        for dsk_type, dsk_progress in [("6030", self.dsk_progress_6030), ("4048", self.dsk_progress_4048)]:
+            # MAP.DR blocks after the first one + root SYS.DR frames + everything in it
+            dsk_progress_value = get_map_dr_block_count(DISK_TYPES[dsk_type][3]) - 1 + self.root_usage + self.usage
+            fraction = dsk_progress_value / get_data_block_count(dsk_type)
+            dsk_progress.set_fraction(fraction)
+            dsk_progress.set_text(f"{dsk_type} Disk Usage\n({dsk_progress_value}/{get_data_block_count(dsk_type)})\n{fraction:.0%}")
+
+    def iter_model_entries(self, model, treeiter=None, prefix=""):
+        # (path, ufd, size) of the rows that get saved, for disk.plan_blocks. Paths are tree paths ("0/3/1"), names don't have to be unique yet
+        treeiter = model.iter_children(treeiter)
+        index = 0
+        while treeiter is not None:
+            model_data = model[treeiter][:]
+            if model_data[MOD_NAME][0:1] != '[':
+                ufd = UFD.new()
+                ufd.set_safe_filename(model_data[MOD_NAME])
+                ufd.set_file_attributes(model_data[MOD_ATTR])
+                yield f"{prefix}{index}", ufd, len(model_data[MOD_DATA]) if model_data[MOD_DATA] is not None else 0
+                if ufd.is_dir(): yield from self.iter_model_entries(model, treeiter, f"{prefix}{index}/")
+            index += 1
+            treeiter = model.iter_next(treeiter)
 
     def new_dsk_from_model(self, model, dsk_type="6030"):
-        match dsk_type:
-            case "6030" | "4048": pass
-            case _: Exception("Unexpected dsk type passed")
-        
-        dsk = None
-        match dsk_type:
-            case "6030": dsk = Disk(b'\x00'*512*616, 'big')
-            case "4048": dsk = Disk(b'\x00'*512*12180, 'big')
-            case _: raise Exception("Unexpected dsk type passed")
-
-        # ADD RAW SYSTEM SECTORS AS NEEDED
-        # Block 0,1 - HIPBOOT (BOOT SECTOR)
-        # Block 2 - Unused
-        # Block 3 - Pointers ("DiskInfo") (This will be modified slightly later)
-        # Block 5 - Unused
-        # Block 7 - SWAP FIB POINTERS
-        # Block 8,9,10,11,12,13,14 - "UNUSED"
+        # Special blocks are the top level "[...]" rows
+        special_blocks = {}
         treeiter = model.get_iter_first()
         while treeiter is not None:
             data = model[treeiter][MOD_DATA]
             if data is not None and len(data) > 0:
-                if model[treeiter][MOD_NAME] == "[HIPBOOT]":
-                    if len(data) <= 1024:
-                        dsk.disk_bytes[0:len(data)] = data
-                    else:
-                        raise Exception("Special block is too big")
-                else:
-                    for i in range(2, 15):
-                        if i == 4: continue
-                        if model[treeiter][MOD_NAME] == f"[BLOCK{i}]":
-                            if len(data) <= 512:
-                                dsk.disk_bytes[(i*512)+0:(i*512)+len(data)] = data
-                                if i >= 6: dsk.set_map_block_bit(i)
-                            else:
-                                raise Exception("Special block is too big")
+                if model[treeiter][MOD_NAME] == "[HIPBOOT]": special_blocks[0] = data
+                for i in range(2, 15):
+                    if i == 4: continue
+                    if model[treeiter][MOD_NAME] == f"[BLOCK{i}]": special_blocks[i] = data
             treeiter = model.iter_next(treeiter)
-        
-        # Block 3 - Pointers ("DiskInfo")
-        dsk.set_word(3, 0, 2) # REV 5
-        match dsk_type:
-            case "6030":
-                dsk.set_word(3, 2, 1) # Tracks
-                dsk.set_word(3, 3, 8) # Sectors/Track
-                dsk.set_word(3, 5, 610) # NumOfBlocks (Technically words 4+5)
-                dsk.set_word(3, 7, 2) # DiskType
-            case "4048":
-                dsk.set_word(3, 2, 10) # Tracks
-                dsk.set_word(3, 3, 6) # Sectors/Track
-                dsk.set_word(3, 5, 12174) # NumOfBlocks (Technically words 4+5)
-                dsk.set_word(3, 7, 0) # DiskType (Is this really 0?)
-            case _: raise Exception("Unexpected dsk type passed")
-        dsk.set_disk_frame_size(int(self.frame_size_control.get_value()))
-        # set_disk_frame_size already fixes the checksum
-        # dsk.fix_diskinfo_checksum()
-
-        # Block 4 - Remap Area
-        dsk.set_word(4, 0, 4)
-        match dsk_type:
-            case "6030": dsk.set_word(4, 2, 616)
-            case "4048": dsk.set_word(4, 2, 12180)
-            case _: raise Exception("Unexpected dsk type passed")
-
-        # Block 6 - SYS.DR
-        dsk.set_map_block_bit(6)
-        
-        # Block 7 - SWAP FIB POINTERS
-        # FrameSize compat/mirror (word 17) is updated from Block3 set_disk_frame_size()
-
-        # Block 15+ - MAP.DR (bigger disks need more then one block)
-        for i in range((dsk.get_word(3, 5) // 8192) + 1):
-            dsk.set_map_block_bit(15 + i)
-
-        # ALLOCATE ROOT SYS.DR FRAMES
-        dsk.add_frames_to_sysdr_block(6)
+        # Check it fits before building anything
+        blocks = plan_blocks(self.iter_model_entries(model), dsk_type, int(self.frame_size_control.get_value()))
+        if blocks > get_data_block_count(dsk_type): raise Exception(f"Doesn't fit on a {dsk_type} ({blocks} blocks needed, {get_data_block_count(dsk_type)} free)")
+        dsk = Disk.new(dsk_type, int(self.frame_size_control.get_value()), special_blocks)
 
         def add_files_to_sysdr(sys_block_id, sysdr_iter):
             while sysdr_iter is not None:
@@ -817,7 +957,7 @@ class DskWindow(Gtk.ApplicationWindow):
                     ufd.set_dct_link(model_data[MOD_DCTLINK])
 
                     # Add file/directory data to disk
-                    afrv = dsk.add_file(sys_block_id, ufd, model_data[MOD_DATA])
+                    afrv = dsk.add_file(sys_block_id, ufd, resolve_data(model_data[MOD_DATA]))
 
                     if ufd.is_dir():
                         newsysdr_iter = model.iter_children(sysdr_iter)
@@ -840,4 +980,8 @@ class DskWindow(Gtk.ApplicationWindow):
             data[MOD_DCTLINK] if MOD_DCTLINK in data else 0,
             data[MOD_MODIFIED] if MOD_MODIFIED in data else "",
             data[MOD_ACCESSED] if MOD_ACCESSED in data else "",
+            0, # MOD_USAGE (worked out in on_row_inserted)
+            0, # MOD_SUBTREE_USAGE
+            -1, # MOD_FIB_OFFSET
+            None, # MOD_NAME_COUNTS
         ])
\ No newline at end of file
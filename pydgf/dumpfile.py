@@ -1,95 +1,259 @@
 import datetime
+import re
+import sys
+import numpy as np
 
 from .attributes import Attributes
 from .ufd import UFD
+from .filecache import resolve_data
+
+def get_data_checksums(data, block_size=1024):
+    # Checksum of each DATA block data is split into.
+    # Assumed to be the usual DG convention: byte count + checksum + data words (big endian, odd byte padded with 0) sum to 0.
+    # NOTE: Not checked against dumps made by RDOS, only against what DumpfileWriter writes (it uses this too)
+    data = np.frombuffer(data, dtype=np.uint8)
+    block_count = (len(data) + block_size - 1) // block_size
+    padded = np.zeros(block_count * block_size, dtype=np.uint8)
+    padded[0:len(data)] = data
+    lengths = np.full(block_count, block_size)
+    if block_count > 0: lengths[-1] = len(data) - (block_count - 1) * block_size
+    sums = padded.view('>u2').reshape(block_count, block_size // 2).sum(axis=1, dtype=np.int64) + lengths
+    return (-sums) % 65536
+
+def is_name_block(data, offset):
+    # Does this look like a NAME block? 0xFF, attributes, (contiguous block count), a valid file name (NUL terminated) then a known block type
+    offset += 1
+    if offset + 2 > len(data): return False
+    if int.from_bytes(data[offset:offset+2], byteorder="big") & 0x0008: offset += 2
+    offset += 2
+    name = bytes(data[offset:offset+14])
+    null_terminator = name.find(b'\0')
+    if null_terminator < 1 or re.fullmatch(b"[A-Z0-9$]{1,10}(\\.[A-Z0-9$]{0,2})?", name[0:null_terminator]) is None: return False
+    offset += null_terminator + 1
+    return offset < len(data) and data[offset] in [0xFF, 0xFE, 0xFC, 0xFB, 0xFA, 0xF9]
 
 class Dumpfile:
+    # raw_bytes can be bytes/memoryview/mmap, or a (buffered) binary stream like an open file
     def __init__(self, raw_bytes):
-        self.raw_bytes = raw_bytes
+        if hasattr(raw_bytes, 'read'):
+            self.stream = raw_bytes
+            self.stream_start = raw_bytes.tell() if raw_bytes.seekable() else 0
+            self.raw_bytes = None
+        else:
+            self.stream = None
+            self.raw_bytes = memoryview(raw_bytes)
+        self.offset = 0
+        # (start offset, end offset, problem) of everything skipped or found bad by iter_files(verify=True/recover=True)
+        self.damaged = []
+
+    def seek(self, offset):
+        if self.stream is not None: self.stream.seek(self.stream_start + offset)
+        self.offset = offset
+    def get_length(self):
+        if self.stream is not None: return self.stream.seek(0, 2) - self.stream_start
+        return len(self.raw_bytes)
+    def find_name_block(self, offset):
+        # Offset of the next thing that looks like a NAME block, None if there isn't one (recover needs a seekable stream)
+        while True:
+            if self.stream is not None:
+                self.stream.seek(self.stream_start + offset)
+                data = self.stream.read(64*1024 + 32)
+            else:
+                data = self.raw_bytes[offset:offset + 64*1024 + 32]
+            for candidate in np.flatnonzero(np.frombuffer(data, dtype=np.uint8)[0:64*1024] == 0xFF).tolist():
+                if is_name_block(data, candidate): return offset + candidate
+            if len(data) <= 64*1024: return None
+            offset += 64*1024
 
-    def get_files(self, skip_starting_nulls = False):
-        offset = 0
+    def read(self, length):
+        # Slices of raw_bytes are views (no copy)
+        if self.stream is not None: data = self.stream.read(length)
+        else: data = self.raw_bytes[self.offset:self.offset+length]
+        self.offset += len(data)
+        if len(data) != length: raise Exception("Unexpected end of dump")
+        return data
+    def read_word(self): return int.from_bytes(self.read(2), byteorder="big")
+    def read_string(self, max_length):
+        # NUL terminated, None if it's longer then max_length
+        string = b''
+        while len(string) <= max_length:
+            char = bytes(self.read(1))
+            if char == b'\0': return string.decode('ascii')
+            string += char
+        return None
+    def read_block_type(self):
+        # None at the end of the dump
+        data = self.stream.read(1) if self.stream is not None else self.raw_bytes[self.offset:self.offset+1]
+        self.offset += len(data)
+        return data[0] if len(data) > 0 else None
+
+    def get_files(self, skip_starting_nulls = False, verify = False, recover = False):
+        return list(self.iter_files(skip_starting_nulls, verify, recover))
+
+    def iter_files(self, skip_starting_nulls = False, verify = False, recover = False):
+        # Yields (ufd, data) for each file as soon as it's complete (the next NAME or END block)
+        # verify checks DATA block checksums. recover doesn't stop at damage, it's noted in self.damaged
+        # and reading carries on from the next NAME block (files cut short by damage are still returned)
         current_ufd = None
-        current_data = b''
+        # Data blocks are kept as a list and joined once the file is complete
+        current_data = []
+        current_length = 0
         current_contiguous_blocks = None
 
-        files = []
-
+        block_type = self.read_block_type()
         if skip_starting_nulls:
-            while self.raw_bytes[offset] == 0:
-                offset += 1
-
-        while offset < len(self.raw_bytes):
-            block_type = self.raw_bytes[offset]
-            offset += 1
-            # DOCS: 093-000109-00 (Page B-1, PDF Page 160)
-            match block_type:
-                case 0xFF: # NAME
-                    if current_ufd is not None:
-                        files.append((current_ufd, current_data))
-
-                    current_ufd = UFD.new()
-                    current_data = b''
-                    current_contiguous_blocks = None
-
-                    current_ufd.set_file_attributes(int.from_bytes(self.raw_bytes[offset:offset+2], byteorder="big"))
-                    offset += 2
-
-                    if current_ufd.get_file_attributes().is_contiguous() > 0:
-                        current_contiguous_blocks = self.raw_bytes[offset:offset+2]
-                        offset += 2
-                        # FIXME?: WHAT DO WE NEED TO DO WITH THIS INFORMATION?
-                    
-                    null_terminator = self.raw_bytes.find(b'\0', offset)
-                    if null_terminator - offset > 13: raise Exception("Filename is too long!")
-                    
-                    current_ufd.set_safe_filename(self.raw_bytes[offset:null_terminator].decode('ascii'))
-                    offset = null_terminator + 1
-                case 0xFE: # DATA
-                    length = int.from_bytes(self.raw_bytes[offset:offset+2], byteorder="big")
-                    offset += 2
-                    
-                    # FIXME: Ignoring checksum
-                    checksum = self.raw_bytes[offset:offset+2] # wordcount % 2 + total contents?
-                    offset += 2
-
-                    if length > 1024:
-                        print(f"Length: {length}")
-                        raise Exception("Unexpected length!")
-
-                    current_data += self.raw_bytes[offset:offset+length]
-                    current_ufd.set_total_byte_count(len(current_data))
-                    offset += length
-                case 0xFD: # ERROR
-                    raise Exception("Unsupported block type: ERROR")
-                case 0xFC: # END
-                    if current_ufd is not None:
-                        files.append((current_ufd, current_data))
-                    return files
-                case 0xFB: # TIME
-                    current_ufd.set_accessed_datetime_from_words(int.from_bytes(self.raw_bytes[offset+0:offset+2], byteorder="big"))
-                    current_ufd.set_modified_datetime_from_words(int.from_bytes(self.raw_bytes[offset+2:offset+4], byteorder="big"), int.from_bytes(self.raw_bytes[offset+4:offset+6], byteorder="big"))
-                    offset += 6
-                case 0xFA: # LINK DATA
-                    null_terminator = self.raw_bytes.find(b'\0', offset)
-                    if null_terminator - offset > 13: raise Exception("ALT DIR NAME is too long!")
-                    alt_dirname = self.raw_bytes[offset:null_terminator].decode('ascii')
-                    offset = null_terminator + 1
-
-                    null_terminator = self.raw_bytes.find(b'\0', offset)
-                    if null_terminator - offset > 13: raise Exception("LINK ALIAS NAME is too long!")
-                    linkname = self.raw_bytes[offset:null_terminator].decode('ascii')
-                    offset = null_terminator + 1
-
-                    print(f"WARNING: IGNORING LINK DATA FOR {current_ufd.get_safe_filename()}: {alt_dirname}/{linkname}")
-                case 0xF9: # LINK ACCESS ATTRIBUTE
-                    current_ufd.set_link_attributes(int.from_bytes(self.raw_bytes[offset:offset+2], byteorder="big"))
-                    offset += 2
-                case 0xF8: # END OF SEGMENT
-                    raise Exception("Unsupported block type: END OF SEGMENT")
-                case _:
-                    print(f"BLOCK TYPE: {hex(int(block_type))[2:]}")
-                    print(f"OFFSET: {offset}")
-                    print(f"{self.raw_bytes[offset-10:offset+10]}")
-                    raise Exception("Unsupported block type: UNKNOWN/INVALID")
-        return files
+            while block_type == 0:
+                block_type = self.read_block_type()
+
+        while block_type is not None:
+            block_offset = self.offset - 1
+            try:
+                # DOCS: 093-000109-00 (Page B-1, PDF Page 160)
+                match block_type:
+                    case 0xFF: # NAME
+                        if current_ufd is not None:
+                            yield current_ufd, b''.join(current_data)
+
+                        current_ufd = UFD.new()
+                        current_data = []
+                        current_length = 0
+                        current_contiguous_blocks = None
+
+                        current_ufd.set_file_attributes(self.read_word())
+
+                        if current_ufd.get_file_attributes().is_contiguous() > 0:
+                            current_contiguous_blocks = self.read(2)
+                            # FIXME?: WHAT DO WE NEED TO DO WITH THIS INFORMATION?
+
+                        filename = self.read_string(13)
+                        if filename is None: raise Exception("Filename is too long!")
+
+                        current_ufd.set_safe_filename(filename)
+                    case 0xFE: # DATA
+                        length = self.read_word()
+
+                        checksum = self.read_word()
+
+                        if length > 1024:
+                            print(f"Length: {length}", file=sys.stderr)
+                            raise Exception("Unexpected length!")
+
+                        data = self.read(length)
+                        if verify and checksum != int(get_data_checksums(data)[0]):
+                            if not recover: raise Exception(f"DATA checksum mismatch at offset {block_offset} (the checksum rule is unverified)")
+                            # The data is kept, it's most likely only a few bytes that are wrong
+                            self.damaged.append((block_offset, self.offset, f"DATA checksum mismatch, the checksum rule is unverified (in {current_ufd.get_safe_filename()})"))
+                        current_data.append(data)
+                        current_length += length
+                        current_ufd.set_total_byte_count(current_length)
+                    case 0xFD: # ERROR
+                        raise Exception("Unsupported block type: ERROR")
+                    case 0xFC: # END
+                        if current_ufd is not None:
+                            yield current_ufd, b''.join(current_data)
+                        return
+                    case 0xFB: # TIME
+                        accessed_date = self.read_word()
+                        modified_date = self.read_word()
+                        modified_time = self.read_word()
+                        current_ufd.set_accessed_datetime_from_words(accessed_date)
+                        current_ufd.set_modified_datetime_from_words(modified_date, modified_time)
+                    case 0xFA: # LINK DATA
+                        alt_dirname = self.read_string(13)
+                        if alt_dirname is None: raise Exception("ALT DIR NAME is too long!")
+
+                        linkname = self.read_string(13)
+                        if linkname is None: raise Exception("LINK ALIAS NAME is too long!")
+
+                        print(f"WARNING: IGNORING LINK DATA FOR {current_ufd.get_safe_filename()}: {alt_dirname}/{linkname}", file=sys.stderr)
+                    case 0xF9: # LINK ACCESS ATTRIBUTE
+                        current_ufd.set_link_attributes(self.read_word())
+                    case 0xF8: # END OF SEGMENT
+                        raise Exception("Unsupported block type: END OF SEGMENT")
+                    case _:
+                        print(f"BLOCK TYPE: {hex(int(block_type))[2:]}", file=sys.stderr)
+                        print(f"OFFSET: {self.offset}", file=sys.stderr)
+                        if self.stream is None: print(f"{bytes(self.raw_bytes[self.offset-10:self.offset+10])}", file=sys.stderr)
+                        raise Exception("Unsupported block type: UNKNOWN/INVALID")
+            except Exception as ex:
+                if not recover: raise
+                # Skip to the next NAME block
+                if block_type == 0xFF: current_ufd = None
+                resync_offset = self.find_name_block(block_offset + 1)
+                problem = f"{ex}" + (f" (in {current_ufd.get_safe_filename()})" if current_ufd is not None else "")
+                self.damaged.append((block_offset, resync_offset if resync_offset is not None else self.get_length(), problem))
+                print(f"WARNING: Dump damaged at offset {block_offset}: {problem}", file=sys.stderr)
+                if resync_offset is None: break
+                self.seek(resync_offset)
+            block_type = self.read_block_type()
+        # No END block
+        if current_ufd is not None:
+            print(f"WARNING: Dump has no END block, {current_ufd.get_safe_filename()} may be incomplete", file=sys.stderr)
+            yield current_ufd, b''.join(current_data)
+
+class DumpfileWriter:
+    # Writes files in the RDOS DUMP format Dumpfile reads (NAME, LINK DATA, LINK ACCESS ATTRIBUTE, TIME, DATA... per file, then END)
+    # NOTE: There are no directories, files from directories have to be flattened (see write_tree)
+    def __init__(self, file):
+        self.file = file
+
+    def write_file(self, ufd, data=b'', link=None):
+        # data is bytes or any iterable of bytes (like a generator), link is (alt dir name, link alias name) for link entries
+        attr = ufd.get_file_attributes()
+        if isinstance(data, (bytes, bytearray, memoryview)): data = [data]
+        # NAME
+        name_block = [b'\xFF', attr.attr_word.to_bytes(2, byteorder="big")]
+        if attr.is_contiguous():
+            # Contiguous files also have their block count, so data has to be all there up front
+            data = [b''.join(data)]
+            name_block.append(((len(data[0]) + 511) // 512).to_bytes(2, byteorder="big"))
+        name_block.append(ufd.get_safe_filename().encode('ascii') + b'\0')
+        # LINK DATA
+        if link is not None:
+            alt_dirname, linkname = link
+            name_block.append(b'\xFA' + alt_dirname.encode('ascii') + b'\0' + linkname.encode('ascii') + b'\0')
+        # LINK ACCESS ATTRIBUTE
+        if ufd.get_link_attributes().attr_word != 0:
+            name_block.append(b'\xF9' + ufd.get_link_attributes().attr_word.to_bytes(2, byteorder="big"))
+        # TIME
+        name_block.append(b'\xFB' + b''.join(word.to_bytes(2, byteorder="big") for word in ufd.get_datetime_words()))
+        self.file.write(b''.join(name_block))
+
+        # DATA, written 64 blocks at a time so big files don't need to be in memory
+        buffer = bytearray()
+        for chunk in data:
+            buffer += chunk
+            if len(buffer) >= 64*1024:
+                full_blocks = len(buffer) - (len(buffer) % 1024)
+                self.write_data(buffer[0:full_blocks])
+                del buffer[0:full_blocks]
+        self.write_data(buffer)
+
+    def write_data(self, data):
+        # DATA blocks of up to 1024 bytes
+        data = bytes(data)
+        checksums = get_data_checksums(data).tolist()
+        blocks = []
+        for index, checksum in enumerate(checksums):
+            block_data = data[index*1024:(index+1)*1024]
+            blocks.append(b'\xFE' + len(block_data).to_bytes(2, byteorder="big") + checksum.to_bytes(2, byteorder="big") + block_data)
+        self.file.write(b''.join(blocks))
+
+    def write_tree(self, entries):
+        # entries are (path, ufd, data) like cli.walk_image, directories are flattened (their files are written, not the directory)
+        names = set()
+        for path, ufd, data in entries:
+            if ufd.is_dir(): continue
+            name = ufd.get_safe_filename()
+            if name in names:
+                print(f"WARNING: {path} not dumped, there is already a {name} (directories are flattened)", file=sys.stderr)
+                continue
+            names.add(name)
+            self.write_file(ufd, resolve_data(data) or b'')
+
+    def close(self):
+        # END
+        self.file.write(b'\xFC')
+
+    def __enter__(self): return self
+    def __exit__(self, *args): self.close()
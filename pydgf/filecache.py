@@ -0,0 +1,68 @@
+import contextlib
+import os
+import tempfile
+from collections import OrderedDict
+
+class FileCache:
+    # Least recently used cache of extracted file data, limited by the total number of bytes held
+    def __init__(self, max_bytes=64*1024*1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, load):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        data = load()
+        data_size = 0 if data is None else len(data)
+        if data_size <= self.max_bytes:
+            self._entries[key] = data
+            self.size += data_size
+            while self.size > self.max_bytes:
+                _, old_data = self._entries.popitem(last=False)
+                self.size -= 0 if old_data is None else len(old_data)
+        return data
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+class LazyFileData:
+    # Stands in for the bytes of a file on a Disk, they are only read (through the cache) when asked for
+    def __init__(self, disk, ufd, cache):
+        self.disk = disk
+        self.ufd = ufd.copy()
+        self.cache = cache
+
+    def get(self):
+        return self.cache.get((self.disk, self.ufd.get_address()), lambda: self.disk.get_file_bytes(self.ufd))
+
+    def __len__(self): return self.ufd.get_total_byte_count()
+    def __bytes__(self): return bytes(self.get())
+    # Pickle (ex: drag and drop to another window) as the real data
+    def __reduce__(self): return (bytes, (bytes(self.get()),))
+
+def resolve_data(data):
+    # Model data can be bytes or a LazyFileData
+    if isinstance(data, LazyFileData): return data.get()
+    return data
+
+@contextlib.contextmanager
+def replace_file(path):
+    # Write path through a temporary file in the same folder that's swapped in (os.replace) once it's complete.
+    # An image that's open (memory mapped, LazyFileData reads through it) keeps the old file, so saving over it is safe.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as file: yield file
+        # mkstemp files are private, use the permissions of the file being replaced (or what open() would give a new one)
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path): os.unlink(temp_path)
+        raise
@@ -1,19 +1,52 @@
 import gi
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk, Pango, GdkPixbuf
-import cairo
+from gi.repository import Gtk, Gdk, Pango, PangoCairo, GdkPixbuf
+import numpy as np
 
-# FIXME: Pretty sure this view breaks on large files
+from .nova import disassemble_words
+
+# Only the lines that are visible get formatted (all at once with numpy) and drawn (one Pango layout per line), formatted lines are cached per mode.
+
+# ASCII column, NUL is blank and other control characters are '.' (they'd break the line up)
+ASCII_TABLE = {c: '.' for c in list(range(0x01, 0x20)) + list(range(0x7F, 0xA0))}
+ASCII_TABLE[0] = ' '
+ASCII_BYTES = bytes(range(256)).decode('latin-1').translate(ASCII_TABLE).encode('latin-1')
+DIGITS = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+
+# mode -> (label, bytes per line)
+MODES = {
+    "hex": ("Hex Bytes", 16),
+    "octal": ("Octal Words", 16),
+    "nova": ("Octal Words + Nova Instructions", 2),
+}
+
+def format_digits(values, digits, bits):
+    # Fixed width hex (bits=4) or octal (bits=3) numbers as characters, one row per value
+    shifts = np.arange(digits - 1, -1, -1) * bits
+    return DIGITS[(np.asarray(values, dtype=np.int64)[:, None] >> shifts) & ((1 << bits) - 1)]
+
+def format_columns(columns, line_count):
+    # columns are byte strings (the same on every line) or character arrays with a row per line, joined into lines of text
+    columns = [np.tile(np.frombuffer(column, dtype=np.uint8), (line_count, 1)) if isinstance(column, bytes) else column.reshape(line_count, -1) for column in columns]
+    text = np.concatenate(columns, axis=1)
+    width = text.shape[1]
+    text = text.tobytes().decode('latin-1')
+    return [text[index*width:(index+1)*width] for index in range(line_count)]
 
 class Hexview(Gtk.ScrolledWindow):
     def __init__(self):
         super().__init__()
         super().set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
 
+        self.data = None
+        self.mode = "hex"
         self.mouse_position = None
         self.min_address_width = 4
         self.padding = 16
+        # mode -> {line number: formatted line}
+        self.line_cache = {}
+        self.max_cached_lines = 4096
 
         self.hex_control = Gtk.DrawingArea()
         self.hex_control.connect("draw", self.on_draw)
@@ -26,6 +59,7 @@ class Hexview(Gtk.ScrolledWindow):
         self.hex_control.connect("button-press-event", self.on_button_press)
         self.hex_control.connect("motion-notify-event", self.on_motion_notify)
         self.hex_control.set_size_request(0, -1)
+        self.hex_control.connect("style-updated", lambda *args: self.update_size())
 
         self.context_menu = Gtk.Menu()
         cm_copy_hex = Gtk.MenuItem("Copy Hex String")
@@ -34,6 +68,13 @@ class Hexview(Gtk.ScrolledWindow):
         cm_copy_string = Gtk.MenuItem('Copy String (without NUL)')
         cm_copy_string.connect("activate", self.on_copy_string_without_nul)
         self.context_menu.append(cm_copy_string)
+        self.context_menu.append(Gtk.SeparatorMenuItem())
+        cm_mode = None
+        for mode, (label, bytes_per_line) in MODES.items():
+            cm_mode = Gtk.RadioMenuItem(label=label, group=cm_mode)
+            cm_mode.set_active(mode == self.mode)
+            cm_mode.connect("toggled", self.on_mode_toggled, mode)
+            self.context_menu.append(cm_mode)
 
         super().add(self.hex_control)
 
@@ -43,6 +84,67 @@ class Hexview(Gtk.ScrolledWindow):
         metrics = fctx.get_metrics(fontdesc)
         return (metrics.approximate_digit_width / Pango.SCALE), (metrics.height / Pango.SCALE)
 
+    def get_address_width(self):
+        # Byte addresses in hex, word addresses in octal
+        if self.mode == "hex": return max(len(hex(len(self.data) - 1)[2:]), self.min_address_width)
+        return max(len(oct((len(self.data) - 1) // 2)[2:]), 6)
+
+    def get_line_count(self):
+        bytes_per_line = MODES[self.mode][1]
+        return (len(self.data) + bytes_per_line - 1) // bytes_per_line
+
+    def get_header(self, address_width):
+        match self.mode:
+            case "hex": return (f"ADDR{' '*(address_width-4)} | 00 01 02 03 04 05 06 07  08 09 0A 0B 0C 0D 0E 0F | 0123456789ABCDEF",
+                                f"{'-'*address_width}-+--------------------------------------------------+-----------------")
+            case "octal": return (f"ADDR{' '*(address_width-4)} | " + "".join(f"+{word:<6}" for word in range(8)) + "| 0123456789ABCDEF",
+                                  f"{'-'*address_width}-+{'-'*57}+-----------------")
+            case "nova": return (f"ADDR{' '*(address_width-4)} | WORD   | 01 | INSTRUCTION",
+                                 f"{'-'*address_width}-+--------+----+-------------------")
+
+    def update_size(self):
+        # The whole file is scrollable, but only what's visible gets drawn
+        if self.data is None:
+            self.hex_control.set_size_request(0, -1)
+            return
+        char_width, line_height = self.get_glyph_size()
+        self.hex_control.set_size_request((char_width * (len(self.get_header(self.get_address_width())[0]) + 2)) + self.padding*2, (self.get_line_count() + 3) * line_height)
+
+    def format_lines(self, first_line, last_line, address_width):
+        # Text of lines first_line up to (not including) last_line
+        bytes_per_line = MODES[self.mode][1]
+        line_count = last_line - first_line
+        data = np.frombuffer(bytes(self.data[first_line*bytes_per_line:last_line*bytes_per_line]), dtype=np.uint8)
+        padded = np.zeros(line_count * bytes_per_line, dtype=np.uint8)
+        padded[0:len(data)] = data
+        # Bytes past the end of the data are left blank
+        missing = np.arange(len(padded)) >= len(data)
+        ascii = np.frombuffer(ASCII_BYTES, dtype=np.uint8)[padded]
+        ascii[missing] = ord(' ')
+        if self.mode == "hex":
+            address = format_digits(np.arange(first_line, last_line) * bytes_per_line, address_width, 4)
+            hex_bytes = np.concatenate([format_digits(padded, 2, 4), np.full((len(padded), 1), ord(' '), dtype=np.uint8)], axis=1)
+            hex_bytes[missing] = ord(' ')
+            hex_bytes = hex_bytes.reshape(line_count, 16, 3)
+            return format_columns([address, b" | ", hex_bytes[:, 0:8], b" ", hex_bytes[:, 8:16], b"| ", ascii], line_count)
+        words = padded.view('>u2')
+        missing_words = missing[0::2]
+        octal_words = np.concatenate([format_digits(words, 6, 3), np.full((len(words), 1), ord(' '), dtype=np.uint8)], axis=1)
+        octal_words[missing_words] = ord(' ')
+        address = format_digits(np.arange(first_line, last_line) * (bytes_per_line // 2), address_width, 3)
+        if self.mode == "octal": return format_columns([address, b" | ", octal_words, b"| ", ascii], line_count)
+        lines = format_columns([address, b" | ", octal_words, b"| ", ascii, b" | "], line_count)
+        return [line + ("" if is_missing else instruction) for line, instruction, is_missing in zip(lines, disassemble_words(words).tolist(), missing_words.tolist())]
+
+    def get_lines(self, first_line, last_line, address_width):
+        # Lines that aren't cached yet are formatted together
+        cache = self.line_cache.setdefault(self.mode, {})
+        uncached = [line for line in range(first_line, last_line) if line not in cache]
+        if len(uncached) > 0:
+            if len(cache) + len(uncached) > self.max_cached_lines: cache.clear()
+            cache.update(zip(range(uncached[0], uncached[-1] + 1), self.format_lines(uncached[0], uncached[-1] + 1, address_width)))
+        return [cache[line] for line in range(first_line, last_line)]
+
     def on_draw(self, widget, context):
         clip_extents = context.clip_extents()
 
@@ -58,56 +160,24 @@ class Hexview(Gtk.ScrolledWindow):
         context.rectangle(*clip_extents)
         context.fill()
 
-        fontdesc = super().get_pango_context().get_font_description()
-        context.set_font_size(fontdesc.get_size() / Pango.SCALE)
-        context.select_font_face(fontdesc.get_family(), cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-
-        def draw_line(str, y_offset):
-            # Optimize with clip bounds
-            if y_offset < clip_extents[1]: return
-            if y_offset > clip_extents[3] + line_height: return
-            # Draw each letter
-            for i, c in enumerate(str):
-                context.set_source_rgb(style_normal_color.red, style_normal_color.blue, style_normal_color.green)
-                context.move_to(i * char_width + self.padding, y_offset)
-                context.show_text(c)
-                context.stroke()
+        def draw_text(text, x, y):
+            layout = widget.create_pango_layout(text)
+            context.move_to(x, y)
+            PangoCairo.show_layout(context, layout)
 
-        if self.data is None:
-            self.hex_control.set_size_request(0, -1)
-            return False
-    
+        if self.data is None: return False
+
+        address_width = self.get_address_width()
 
-        address_width = len(hex(len(self.data) - 1)[2:])
-        if address_width < self.min_address_width: address_width = self.min_address_width
-
-        self.hex_control.set_size_request((char_width * (70 + address_width)) + self.padding*2, (len(self.data)//16 + 3) * line_height)
-        y_offset = line_height
-        draw_line(f"ADDR{' '*(address_width-4)} | 00 01 02 03 04 05 06 07  08 09 0A 0B 0C 0D 0E 0F | 0123456789ABCDEF", y_offset)
-        y_offset += line_height
-        draw_line(f"{'-'*address_width}-+--------------------------------------------------+-----------------", y_offset)
-        for line in range(((len(self.data)-1)//16)+1):
-            y_offset += line_height
-
-            # Optimize with clip bounds
-            if y_offset < clip_extents[1]: continue
-            if y_offset > clip_extents[3] + line_height: continue
-
-            addr = f"{(line * 16):0{address_width}X}"
-            hex_str = " "
-            ascii_str = ""
-            for char_index in range(16):
-                data_index = line * 16 + char_index
-                if data_index < len(self.data):
-                    hex_str += f"{(self.data[data_index]):02X} "
-                    if self.data[data_index] == 0: ascii_str += ' '
-                    else: ascii_str += chr(self.data[data_index])
-                else:
-                    hex_str += "   "
-                    ascii_str += " "
-                if char_index == 7:hex_str += " "
-
-            draw_line(f"{addr} |{hex_str}| {ascii_str}", y_offset)
+        # Only the rows in the clip (the scrolled to part of the file), rows 0 and 1 are the header, data lines start at row 2
+        first_row = max(int(clip_extents[1] // line_height), 0)
+        last_row = min(int(clip_extents[3] // line_height) + 1, self.get_line_count() + 2)
+        header = self.get_header(address_width)
+        first_line = max(first_row - 2, 0)
+        lines = self.get_lines(first_line, max(last_row - 2, 0), address_width)
+        context.set_source_rgb(style_normal_color.red, style_normal_color.green, style_normal_color.blue)
+        for row in range(first_row, last_row):
+            draw_text(header[row] if row < 2 else lines[row - 2 - first_line], self.padding, row * line_height)
 
         # Draw mouse cursor
         # if self.mouse_position is not None:
@@ -137,8 +207,8 @@ class Hexview(Gtk.ScrolledWindow):
             [46,47,66], # F
         ]
 
-        # Draw prelight text
-        if self.mouse_position is not None:
+        # Draw prelight text (x_offsets are the hex mode columns)
+        if self.mouse_position is not None and self.mode == "hex":
             mc_x, mc_y = self.mouse_position
 
             if mc_y >= line_height * 2:
@@ -149,7 +219,7 @@ class Hexview(Gtk.ScrolledWindow):
                     data_offset = data_y * 16 + i
                     if data_offset < len(self.data) and offset in o:
                         # Backgrounds of Hex/String
-                        context.set_source_rgb(style_prelight_color.red, style_prelight_color.blue, style_prelight_color.green)
+                        context.set_source_rgb(style_prelight_color.red, style_prelight_color.green, style_prelight_color.blue)
                         x = self.padding + (address_width + 3 + o[0])*char_width
                         context.rectangle(x, y, char_width*2, line_height)
                         x = self.padding + (address_width + 3 + o[2])*char_width
@@ -158,19 +228,13 @@ class Hexview(Gtk.ScrolledWindow):
                         # Redo Data
                         data = self.data[data_offset]
                         # Redo Hex
-                        context.set_source_rgb(style_prelight_background_color.red, style_prelight_background_color.blue, style_prelight_background_color.green)
+                        context.set_source_rgb(style_prelight_background_color.red, style_prelight_background_color.green, style_prelight_background_color.blue)
                         x = self.padding + (address_width + 3 + o[0])*char_width
-                        hex_str = f"{data:02X}"
-                        context.move_to(x, y + line_height)
-                        context.show_text(hex_str[0])
-                        context.move_to(x + char_width, y + line_height)
-                        context.show_text(hex_str[1])
+                        draw_text(f"{data:02X}", x, y)
                         # Redo Text
                         if data != 0:
                             x = self.padding + (address_width + 3 + o[2])*char_width
-                            context.move_to(x, y + line_height)
-                            context.show_text(chr(data))
-                        context.stroke()
+                            draw_text(chr(data).translate(ASCII_TABLE), x, y)
 
         return False
     
@@ -206,6 +270,17 @@ class Hexview(Gtk.ScrolledWindow):
                 if c > 0: txt += chr(c)
             Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD).set_text(txt, len(txt))
 
+    def on_mode_toggled(self, widget, mode):
+        if widget.get_active(): self.set_mode(mode)
+
+    def set_mode(self, mode):
+        # Lines already formatted in a mode stay cached, switching back and forth doesn't format them again
+        self.mode = mode
+        self.update_size()
+        self.hex_control.queue_draw()
+
     def set_data(self, data):
         self.data = data
+        self.line_cache = {}
+        self.update_size()
         self.hex_control.queue_draw()
@@ -1,22 +1,52 @@
+import io
+import mmap
+import os
+import sys
+from collections.abc import Mapping
+
+from .filecache import replace_file
+
 # Lots of hard coded things that probably break compatibility with some files, oh well, better then none
 
 # Things like "Free Format" will definitely break things
 
+def map_tape(source):
+    # Paths and file objects are memory mapped (read only), anything else (bytes, mmap, ...) is used as is
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file: return map_tape(file)
+    if hasattr(source, 'fileno'):
+        try:
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            # Pipes and empty files can't be mapped
+            return source.read()
+    return source
+
 class Magtape:
+    # Records are only read as they are needed, the record index (file number -> record data offsets) is built as the tape is read
     def __init__(self, raw_bytes):
-        eof = False
+        self.raw_bytes = memoryview(map_tape(raw_bytes))
+        # file number -> [(offset, length)] of the data in each record
+        self.records = {}
+        self._reader = self.iter_records()
+        self._read_all = False
+        # Works like a {file number: bytes} dict, but a file is only read when it's used
+        self.files = MagtapeFiles(self)
+
+    def iter_records(self):
+        # (file number, offset, length) of the data in every record, in tape order
+        raw_bytes = self.raw_bytes
         did_warning = False
         needs_warning = False
         oldrecord = None
         offset = 0
         last_fileno = 0
-        self.files = {}
         while offset < len(raw_bytes):
             metadata = raw_bytes[offset:offset+4]
             offset += 4
 
             # Pretty sure any 9trk files that exist are all in little endian format
-            record_length = int.from_bytes(metadata[0:4], byteorder='little')
+            record_length = int.from_bytes(metadata, byteorder='little')
 
             if record_length == 0:
                 # if verbose: print("Marker")
@@ -32,21 +62,22 @@ class Magtape:
                 raise Exception("Unexpected end of medium?")
             if record_length == 0x0000FFFF:
                 # "BAD" files
-                if verbose: print(f'"BAD" file')
+                # if verbose: print(f'"BAD" file')
                 trail = raw_bytes[offset:offset+4]
                 offset += 4
                 if len(trail) != 4: raise Exception("Unexpected EOF (Trail)")
-                if metadata != trail: raise Exception("Invalid record trail!")        
+                if metadata != trail: raise Exception("Invalid record trail!")
                 continue
             if record_length != 514:
                 # Only validated with files that were this way, others do exist though
-                print(f"WARNING: WAS EXPECTING RECORD LENGTH OF 514, WAS {record_length}")
-                
+                print(f"WARNING: WAS EXPECTING RECORD LENGTH OF 514, WAS {record_length}", file=sys.stderr)
+
+            record_offset = offset
             record = raw_bytes[offset:offset+record_length]
             offset += record_length
-            
-            if record_length % 1 != 0: offset += 1 # Padding if length is odd
-            
+
+            if record_length % 2 != 0: offset += 1 # Padding if length is odd
+
             trail = raw_bytes[offset:offset+4]
             offset += 4
 
@@ -56,22 +87,109 @@ class Magtape:
             fileno1 = int.from_bytes(record[record_length-4:record_length-2], byteorder='big')
             fileno2 = int.from_bytes(record[record_length-2:record_length], byteorder='big')
             if fileno1 != fileno2:
-                print(f"WARNING: File number does not match! ({fileno1} != {fileno2})")
+                print(f"WARNING: File number does not match! ({fileno1} != {fileno2})", file=sys.stderr)
                 #raise Exception("File number does not match!")
-            
+
             if fileno1 > last_fileno + 1 or fileno1 < last_fileno:
-                print(f"WARNING: File number sequence is unexpected (last={last_fileno} current={fileno1})")
+                print(f"WARNING: File number sequence is unexpected (last={last_fileno} current={fileno1})", file=sys.stderr)
             last_fileno = fileno1
 
             if fileno1 > 99:
                 # raise Exception("File number is larger then supported by RDOS")
-                print(f"WARNING: File number is larger then supported by RDOS ({fileno1})")
+                print(f"WARNING: File number is larger then supported by RDOS ({fileno1})", file=sys.stderr)
 
             if needs_warning and not did_warning:
-                print("WARNING: If any data follows it may have been erased from the tape!")
+                print("WARNING: If any data follows it may have been erased from the tape!", file=sys.stderr)
                 did_warning = True
-            if not fileno1 in self.files:
-                self.files[fileno1] = b""
-            self.files[fileno1] += record[0:record_length-4]
 
-            oldrecord = record
\ No newline at end of file
+            yield fileno1, record_offset, record_length - 4
+
+            oldrecord = record
+
+    def read_records(self, fileno=None):
+        # Index records until one after file fileno is found (or all of them)
+        if self._read_all: return
+        for record_fileno, offset, length in self._reader:
+            if record_fileno not in self.records: self.records[record_fileno] = []
+            self.records[record_fileno].append((offset, length))
+            if fileno is not None and record_fileno > fileno: return
+        self._read_all = True
+
+    def get_file_numbers(self):
+        self.read_records()
+        return list(self.records)
+
+    def iter_file(self, fileno):
+        # Data of a tape file as views into the tape (no copies), one per record
+        self.read_records(fileno)
+        for offset, length in self.records.get(fileno, []):
+            yield self.raw_bytes[offset:offset+length]
+
+    def get_file(self, fileno):
+        self.read_records(fileno)
+        if fileno not in self.records: raise KeyError(fileno)
+        return b''.join(self.iter_file(fileno))
+
+class MagtapeFiles(Mapping):
+    def __init__(self, magtape): self.magtape = magtape
+    def __getitem__(self, fileno): return self.magtape.get_file(fileno)
+    def __iter__(self): return iter(self.magtape.get_file_numbers())
+    def __len__(self): return len(self.magtape.get_file_numbers())
+
+class MagtapeWriter:
+    # Writes tapes the way Magtape reads them, record_size bytes of data then the file number twice (big endian words) in each record.
+    # Each record is framed by its length (little endian) before and after, tape files end with a tape mark and the tape with two.
+    def __init__(self, file, record_size=510, pad_last_record=True):
+        self.file = file
+        self.record_size = record_size
+        # RDOS tapes only seem to have full records, short tape files get zeros added to the last record
+        self.pad_last_record = pad_last_record
+        self.fileno = 0
+
+    def write_record(self, data):
+        header = len(data).to_bytes(4, byteorder='little')
+        # Padding if length is odd
+        self.file.write(b''.join([header, data, b'\0' if len(data) % 2 != 0 else b'', header]))
+
+    def write_mark(self): self.file.write(b'\0\0\0\0')
+
+    def write_file(self, chunks, fileno=None):
+        # chunks is bytes or any iterable of bytes (like a generator), only one record is kept in memory at a time
+        if fileno is not None: self.fileno = fileno
+        if isinstance(chunks, (bytes, bytearray, memoryview)): chunks = [chunks]
+        trailer = self.fileno.to_bytes(2, byteorder='big') * 2
+        record = bytearray()
+        records = 0
+        for chunk in chunks:
+            chunk = memoryview(chunk).cast('B')
+            # Full records straight from the chunk
+            while len(record) == 0 and len(chunk) >= self.record_size:
+                self.write_record(b''.join([chunk[0:self.record_size], trailer]))
+                records += 1
+                chunk = chunk[self.record_size:]
+            while len(chunk) > 0:
+                used = min(self.record_size - len(record), len(chunk))
+                record += chunk[0:used]
+                chunk = chunk[used:]
+                if len(record) == self.record_size:
+                    self.write_record(record + trailer)
+                    records += 1
+                    record = bytearray()
+        # Empty tape files still get a record, otherwise the file number would be missing
+        if len(record) > 0 or records == 0:
+            if self.pad_last_record: record += b'\0' * (self.record_size - len(record))
+            self.write_record(record + trailer)
+        self.write_mark()
+        self.fileno += 1
+
+    def close(self):
+        # End of tape
+        self.write_mark()
+
+    def __enter__(self): return self
+    def __exit__(self, *args): self.close()
+
+def write_tape(path, tape_files, record_size=510, pad_last_record=True):
+    # tape_files is an iterable of tape files (bytes or iterables of bytes), numbered from 0
+    with replace_file(path) as file, MagtapeWriter(file, record_size, pad_last_record) as writer:
+        for chunks in tape_files: writer.write_file(chunks)
@@ -0,0 +1,58 @@
+import numpy as np
+
+# Data General Nova instructions (the basic set, no Eclipse/multiply/floating point extensions).
+# Bit numbers follow the DG docs, bit 0 is the most significant bit of the word. Numbers are octal like the assembler.
+# DOCS: 015-000009 (How To Use The Nova Computers)
+
+ALC_FUNCTIONS = ["COM", "NEG", "MOV", "INC", "ADC", "SUB", "ADD", "AND"]
+ALC_SHIFTS = ["", "L", "R", "S"]
+ALC_CARRIES = ["", "Z", "O", "C"]
+ALC_SKIPS = ["", "SKP", "SZC", "SNC", "SZR", "SNR", "SEZ", "SBN"]
+MEMORY_FUNCTIONS = ["JMP", "JSR", "ISZ", "DSZ"]
+IO_FUNCTIONS = ["NIO", "DIA", "DOA", "DIB", "DOB", "DIC", "DOC", "SKP"]
+IO_CONTROLS = ["", "S", "C", "P"]
+IO_SKIPS = ["BN", "BZ", "DN", "DZ"]
+DEVICES = {0o10: "TTI", 0o11: "TTO", 0o12: "PTR", 0o13: "PTP", 0o14: "RTC", 0o15: "PLT", 0o17: "LPT", 0o20: "DSK", 0o22: "MTA", 0o33: "DKP", 0o77: "CPU"}
+# (transfer, control) -> CPU (device 77) instructions with their own mnemonics
+CPU_INSTRUCTIONS = {(0, 1): "INTEN", (0, 2): "INTDS", (1, 0): "READS {ac}", (3, 0): "INTA {ac}", (4, 0): "MSKO {ac}", (5, 2): "IORST", (6, 0): "HALT"}
+
+MNEMONICS = None
+
+def get_address(word):
+    # [@]displacement[,index], the displacement is signed unless it's page zero (index 0)
+    index = (word >> 8) & 3
+    displacement = word & 0xFF
+    if index != 0 and displacement > 127: displacement -= 256
+    return f"{'@' if word & 0x400 else ''}{'-' if displacement < 0 else ''}{abs(displacement):o}{f',{index}' if index != 0 else ''}"
+
+def disassemble(word):
+    if word & 0x8000:
+        # Arithmetic/logic: 1 SRC DST FUNC SH CRY # SKIP
+        mnemonic = ALC_FUNCTIONS[(word >> 8) & 7] + ALC_CARRIES[(word >> 4) & 3] + ALC_SHIFTS[(word >> 6) & 3] + ('#' if word & 8 else '')
+        skip = ALC_SKIPS[word & 7]
+        return f"{mnemonic} {(word >> 13) & 3},{(word >> 11) & 3}{',' + skip if skip else ''}"
+    match word >> 13:
+        case 0: # JMP/JSR/ISZ/DSZ: 000 FUNC @ INDEX DISPLACEMENT
+            return f"{MEMORY_FUNCTIONS[(word >> 11) & 3]} {get_address(word)}"
+        case 1 | 2: # LDA/STA: 0 FUNC AC @ INDEX DISPLACEMENT
+            return f"{'LDA' if word >> 13 == 1 else 'STA'} {(word >> 11) & 3},{get_address(word)}"
+    # I/O: 011 AC TRANSFER CONTROL DEVICE
+    ac = (word >> 11) & 3
+    transfer = (word >> 8) & 7
+    control = (word >> 6) & 3
+    device = word & 0x3F
+    if device == 0o77 and (transfer, control) in CPU_INSTRUCTIONS: return CPU_INSTRUCTIONS[(transfer, control)].format(ac=ac)
+    device_name = DEVICES.get(device, f"{device:o}")
+    if transfer == 7: return f"SKP{IO_SKIPS[control]} {device_name}"
+    if transfer == 0: return f"NIO{IO_CONTROLS[control]} {device_name}"
+    return f"{IO_FUNCTIONS[transfer]}{IO_CONTROLS[control]} {ac},{device_name}"
+
+def get_mnemonics():
+    # Every word disassembled, built the first time it's needed (a lookup is a lot faster then decoding each word)
+    global MNEMONICS
+    if MNEMONICS is None: MNEMONICS = np.array([disassemble(word) for word in range(65536)], dtype=object)
+    return MNEMONICS
+
+def disassemble_words(words):
+    # words is anything numpy can turn into an array of 16 bit words (like np.frombuffer(data, '>u2'))
+    return get_mnemonics()[np.asarray(words, dtype=np.uint16)]
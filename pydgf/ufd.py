@@ -4,36 +4,58 @@ import numpy as np
 
 from .attributes import Attributes
 
+# Layout of the 18 words of a UFD on disk
+UFD_DTYPE = np.dtype([
+    ('name', 'S10'),
+    ('extension', 'S2'),
+    ('attributes', '>u2'),
+    ('link_attributes', '>u2'),
+    ('logical_block_count', '>u2'),
+    ('bytes_in_last_block', '>u2'),
+    ('address', '>u2'),
+    ('accessed_date', '>u2'),
+    ('modified_date', '>u2'),
+    ('modified_time', '>u2'),
+    ('temp1', '>u2'),
+    ('temp2', '>u2'),
+    ('uftuc', '>u2'),
+    ('dct_link', '>u2'),
+])
+
 class UFD:
     _words = None
    
+    # NOTE: ufd_words can be a row of a UFDTable (or disk block), changes are then made to that memory
     def __init__(self, ufd_words):
         if len(ufd_words) != 18: raise Exception("Unexpected UFD word size!")
-        self._words = ufd_words
+        if type(ufd_words) is np.ndarray and ufd_words.dtype == '>u2': self._words = ufd_words
+        else: self._words = np.array(ufd_words, dtype='>u2')
 
     @classmethod
-    def new(cls): return cls([0]*18)
+    def new(cls): return cls(np.zeros(18, dtype='>u2'))
+
+    def copy(self): return UFD(self._words.copy())
 
     def is_deleted(self): return self._words[0] == 0
 
-    def to_bytes(self, byteorder): return bytes().join(i.to_bytes(2, byteorder) for i in self._words)
+    def to_bytes(self, byteorder): return self._words.astype('>u2' if byteorder == 'big' else '<u2').tobytes()
 
     # Should only be ALPHANUM and $
     def get_safe_filename(self):
-        return (self._words[0].to_bytes(2) + self._words[1].to_bytes(2) + self._words[2].to_bytes(2) + self._words[3].to_bytes(2) + self._words[4].to_bytes(2) + b'.' + self._words[5].to_bytes(2)).replace(b'\0', b'').decode('ascii')
+        name = self._words[0:6].tobytes()
+        return (name[0:10] + b'.' + name[10:12]).replace(b'\0', b'').decode('ascii')
     def set_safe_filename(self, newname):
         parts = newname.upper().split('.')
         x = "".join(re.findall("[A-Z\\$0-9]", parts[0]))
-        x = np.frombuffer(x.encode('ascii') + b'\x00'*10, dtype='>u2', count=5).tolist()
-        for i in range(5): self._words[i] = x[i]
+        self._words[0:5] = np.frombuffer(x.encode('ascii') + b'\x00'*10, dtype='>u2', count=5)
         if len(parts) > 1:
             x = "".join(re.findall("[A-Z\\$0-9]", parts[1]))
-            self._words[5] = np.frombuffer(x.encode('ascii') + b'\x00\x00', dtype='>u2', count=1).tolist()[0]
+            self._words[5] = np.frombuffer(x.encode('ascii') + b'\x00\x00', dtype='>u2', count=1)[0]
         else:
             self._words[5] = 0
 
     def get_file_attributes(self):
-        return Attributes(self._words[6])
+        return Attributes(int(self._words[6]))
     def set_file_attributes(self, attr):
         if type(attr) is Attributes: self._words[6] = attr.attr_word
         elif type(attr) is int: self._words[6] = attr
@@ -41,17 +63,19 @@ class UFD:
         else: raise Exception("Oops")
 
     def get_link_attributes(self):
-        return Attributes(self._words[7])
+        return Attributes(int(self._words[7]))
     def set_link_attributes(self, attr):
         if type(attr) is Attributes: self._words[7] = attr.attr_word
         elif type(attr) is int: self._words[7] = attr
         elif type(attr) is str: self._words[7] = Attributes.from_string(attr).attr_word
         else: raise Exception("Oops")
 
-    def get_logical_block_count(self): return self._words[8]
-    def get_bytes_in_last_block(self): return self._words[9]
+    def get_logical_block_count(self): return int(self._words[8])
+    def get_bytes_in_last_block(self): return int(self._words[9])
     def get_total_byte_count(self):
-        count = self.get_logical_block_count()*512 + self.get_bytes_in_last_block()
+        # Sequential blocks only hold 510 bytes, the last word links the blocks together
+        block_size = 510 if self.get_file_attributes().is_sequential() else 512
+        count = self.get_logical_block_count()*block_size + self.get_bytes_in_last_block()
         return count
     def set_total_byte_count(self, count, attr=None):
         if attr is None: attr = self.get_file_attributes()
@@ -74,11 +98,14 @@ class UFD:
                 self._words[9] = 512
         else: raise Exception("Cannot automatically set byte count as we don't understand its attr")
 
-    def get_address(self): return self._words[10]
+    def get_address(self): return int(self._words[10])
     def set_address(self, block_id): self._words[10] = block_id
 
+    # (accessed date, modified date, modified time) words, the same as a dump's TIME block
+    def get_datetime_words(self): return int(self._words[11]), int(self._words[12]), int(self._words[13])
+
     def get_accessed_datetime(self):
-        return datetime.datetime(1967, 12, 31) + datetime.timedelta(days = self._words[11])
+        return datetime.datetime(1967, 12, 31) + datetime.timedelta(days = int(self._words[11]))
     def set_accessed_datetime_from_words(self, date):
         if type(date) is int: self._words[11] = date
         else: raise Exception("Oops")
@@ -94,7 +121,7 @@ class UFD:
         else: raise Exception("Oops")
 
     def get_modified_datetime(self):
-        return datetime.datetime(1967, 12, 31) + datetime.timedelta(days = self._words[12], hours = int(self._words[13] / 256), minutes = self._words[13] % 256)
+        return datetime.datetime(1967, 12, 31) + datetime.timedelta(days = int(self._words[12]), hours = int(self._words[13]) // 256, minutes = int(self._words[13]) % 256)
     def set_modified_datetime_from_words(self, date, time):
         if type(date) is int: self._words[12] = date
         else: raise Exception("Oops")
@@ -115,7 +142,7 @@ class UFD:
         else: raise Exception("Oops")
 
     def get_uftuc_string(self):
-        uftuc = self._words[16]
+        uftuc = int(self._words[16])
         out = ''
         # I think this is right
         if uftuc & 0xC000 == 0xC000: out += 'ROPEN'
@@ -126,7 +153,7 @@ class UFD:
         return out
     
     def get_dct_link(self):
-        return self._words[17]
+        return int(self._words[17])
     def set_dct_link(self, word):
         self._words[17] = word
 
@@ -140,9 +167,7 @@ class UFD:
 
     def get_sysdr_fib_offset(self, frame_size):
         # 019-000048-04 (Page 6-6, PDF Page 88)
-        offset = 0
-        for i in range(6): offset += self._words[i]
-        offset &= 0xFFFF
+        offset = int(self._words[0:6].sum()) & 0xFFFF
         return offset % frame_size
 
     def dump(self, indent = 0, frame_size = None, sysdr_fib_offset = None):
@@ -166,3 +191,57 @@ class UFD:
             if valid_offset: print(f"{'\t'*indent}SYS.DR Offset: VALID ({offset})")
             else: print(f"{'\t'*indent}SYS.DR Offset: INVALID ({sysdr_fib_offset}!={offset})")
 
+class UFDTable:
+    # Decodes a run of UFDs (ex: a directory entry block or a whole SYS.DR) at once.
+    # Rows are views, so UFDs from a table built over a disk block read/write the disk.
+    def __init__(self, ufd_words, fib_indexes=None):
+        self.words = np.asarray(ufd_words, dtype='>u2').reshape(-1, 18)
+        self.entries = self.words.view(UFD_DTYPE)[:, 0]
+        # SYS.DR word each entry was found through (Only set for a whole SYS.DR)
+        self.fib_indexes = fib_indexes
+
+    @classmethod
+    def from_block(cls, block_words, count=14):
+        # Word 0 is the entry count, followed by up to 14 UFDs
+        return cls(block_words[1:(count*18)+1])
+
+    def __len__(self): return len(self.words)
+    def __getitem__(self, index): return UFD(self.words[index])
+    def __iter__(self):
+        for index in range(len(self.words)): yield UFD(self.words[index])
+
+    @property
+    def in_use(self): return self.words[:, 0] != 0
+    @property
+    def names(self):
+        if len(self.words) == 0: return np.array([], dtype=str)
+        names = np.char.add(np.char.add(self.entries['name'], b'.'), self.entries['extension'])
+        return np.char.decode(np.char.replace(names, b'\0', b''), 'ascii')
+    @property
+    def attributes(self): return self.entries['attributes']
+    @property
+    def link_attributes(self): return self.entries['link_attributes']
+    @property
+    def addresses(self): return self.entries['address']
+    @property
+    def logical_block_counts(self): return self.entries['logical_block_count']
+    @property
+    def bytes_in_last_block(self): return self.entries['bytes_in_last_block']
+    @property
+    def total_byte_counts(self):
+        block_sizes = np.where(self.is_sequential(), 510, 512)
+        return self.logical_block_counts.astype(np.int64)*block_sizes + self.bytes_in_last_block
+    @property
+    def accessed_dates(self): return np.datetime64('1967-12-31') + self.entries['accessed_date'].astype('timedelta64[D]')
+    @property
+    def modified_dates(self):
+        times = self.entries['modified_time'].astype(np.int64)
+        return (np.datetime64('1967-12-31T00:00') + self.entries['modified_date'].astype('timedelta64[D]')
+                + (times // 256).astype('timedelta64[h]') + (times % 256).astype('timedelta64[m]'))
+    @property
+    def dct_links(self): return self.entries['dct_link']
+
+    def is_dir(self): return (self.attributes & 0x0400) != 0
+    def is_link(self): return (self.attributes & 0x1000) != 0
+    def is_file(self): return (self.attributes & (0x1000 | 0x0800 | 0x0400)) == 0
+    def is_sequential(self): return (self.attributes & (0x0008 | 0x0004)) == 0
@@ -0,0 +1,59 @@
+import os
+
+from pydgf import cli
+from pydgf.disk import Disk
+
+def make_source(folder):
+    os.makedirs(os.path.join(folder, "SUB"))
+    with open(os.path.join(folder, "B"), 'wb') as file: file.write(b"no extension")
+    with open(os.path.join(folder, "SUB", "C.SR"), 'wb') as file: file.write(b"source")
+    return folder
+
+def test_build_names(tmp_path, capfdbinary):
+    source = make_source(tmp_path / "T")
+    assert cli.main(["build", str(source)]) == 0
+    image = tmp_path / "T.dsk"
+    assert Disk(str(image)).lookup("SUB.DR").is_dir()
+    assert cli.main(["cat", str(image), "SUB.DR:C.SR", "b"]) == 0
+    assert capfdbinary.readouterr().out == b"no extensionsource"
+
+def test_extract_round_trip(tmp_path):
+    source = make_source(tmp_path / "T")
+    cli.main(["build", str(source)])
+    cli.main(["extract", "-o", str(tmp_path / "out"), str(tmp_path / "T.dsk")])
+    # No trailing '.' on names without an extension
+    assert sorted(os.listdir(tmp_path / "out" / "T")) == ["B", "SUB.DR"]
+    assert (tmp_path / "out" / "T" / "SUB.DR" / "C.SR").read_bytes() == b"source"
+    # And it builds back to the same names
+    cli.main(["build", "-o", str(tmp_path / "again.dsk"), str(tmp_path / "out" / "T")])
+    assert cli.ls_image(str(tmp_path / "again.dsk")) == cli.ls_image(str(tmp_path / "T.dsk"))
+
+def test_extract_unsafe_names(tmp_path, capfd):
+    source = make_source(tmp_path / "T")
+    cli.main(["build", str(source)])
+    # Rename B. (damaged/crafted image) to ../../X and SUB.DR to ..
+    dsk = Disk(str(tmp_path / "T.dsk"))
+    dsk.lookup("B")._words[0:6] = [0x2E2E, 0x2F2E, 0x2E2F, 0x5800, 0, 0]
+    dsk.lookup("SUB.DR")._words[0:6] = [0x2E00, 0, 0, 0, 0, 0]
+    (tmp_path / "bad.dsk").write_bytes(dsk.disk_bytes)
+    cli.main(["extract", "-o", str(tmp_path / "out" / "deep"), str(tmp_path / "bad.dsk")])
+    assert os.listdir(tmp_path / "out" / "deep" / "bad") == []
+    assert sorted(os.listdir(tmp_path / "out")) == ["deep"]
+    assert "not extracted" in capfd.readouterr().err
+
+def test_get_extract_path(tmp_path):
+    assert cli.get_extract_path(str(tmp_path), "A.DR/B.") == os.path.join(str(tmp_path), "A.DR", "B")
+    for path in ["..", "../X", "A.DR/..", "A.DR/../../X", ".", "/X", "A\0B"]:
+        assert cli.get_extract_path(str(tmp_path), path) is None
+
+def test_fsck_checksums(tmp_path, capfd):
+    source = make_source(tmp_path / "T")
+    cli.main(["build", "-t", "dp", str(source)])
+    dump = tmp_path / "T.dp"
+    assert cli.main(["fsck", str(dump)]) == 0
+    # A changed byte only shows up when checksums are checked, and it's labeled as unverified
+    dump.write_bytes(dump.read_bytes().replace(b"source", b"sourcE"))
+    assert cli.main(["fsck", str(dump)]) == 0
+    capfd.readouterr()
+    assert cli.main(["fsck", "--verify-checksums", str(dump)]) == 1
+    assert "checksum rule is unverified" in capfd.readouterr().out
@@ -0,0 +1,32 @@
+import pytest
+
+from pydgf.disk import Disk
+from pydgf.ufd import UFD
+
+def add(dsk, sysdr_block_id, name, attributes, data):
+    ufd = UFD.new()
+    ufd.set_safe_filename(name)
+    ufd.set_file_attributes(attributes)
+    if data is not None: ufd.set_total_byte_count(len(data), ufd.get_file_attributes())
+    return dsk.add_file(sysdr_block_id, ufd, data)
+
+# A frame holds 14 * frame_size names (less when the hashes aren't even), these all need overflow frames
+@pytest.mark.parametrize("frame_size, count, subdirectory", [(1, 300, True), (5, 3000, False), (5, 3000, True), (7, 500, True)])
+def test_directory_overflow_frames(frame_size, count, subdirectory):
+    dsk = Disk.new("4048", frame_size)
+    directory = add(dsk, 6, "BIG.DR", "YD", None) if subdirectory else 6
+    for i in range(count): add(dsk, directory, f"N{i}", "", bytes([i % 256]))
+    # Read back from a fresh Disk (no DirectoryIndex left over)
+    dsk = Disk(dsk.disk_bytes.tobytes())
+    prefix = "BIG.DR:" if subdirectory else ""
+    frame_blocks = len(dsk.get_directory_blocks(directory)) - len(dsk.get_index_chain(directory))
+    assert frame_blocks > frame_size and frame_blocks % frame_size == 0
+    # SYS.DR's size (and the directory's in its parent) covers the frames
+    assert dsk.lookup(prefix + "SYS.DR").get_total_byte_count() == frame_blocks * 512
+    if subdirectory: assert dsk.lookup("BIG.DR").get_total_byte_count() == frame_blocks * 512
+    names = dsk.get_directory_table(directory).names.tolist()
+    assert len(names) == count + 2
+    for i in range(count):
+        ufd = dsk.lookup(f"{prefix}N{i}")
+        assert ufd is not None and dsk.get_file_bytes(ufd) == bytes([i % 256])
+    assert dsk.check() == []
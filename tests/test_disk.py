@@ -0,0 +1,46 @@
+import pytest
+
+from pydgf.disk import Disk
+from pydgf.ufd import UFD
+
+def add(dsk, sysdr_block_id, name, attributes, data):
+    ufd = UFD.new()
+    ufd.set_safe_filename(name)
+    ufd.set_file_attributes(attributes)
+    if data is not None: ufd.set_total_byte_count(len(data), ufd.get_file_attributes())
+    return dsk.add_file(sysdr_block_id, ufd, data)
+
+def test_get_file_bytes_is_a_copy():
+    # Every kind of file comes back as bytes that don't change when the disk is edited
+    dsk = Disk.new("6030")
+    for name, attributes in [("C.DA", "C"), ("R.DA", "D"), ("S.DA", "")]: add(dsk, 6, name, attributes, b"abc" * 400)
+    for name in ["C.DA", "R.DA", "S.DA"]:
+        ufd = dsk.lookup(name)
+        data = dsk.get_file_bytes(ufd)
+        assert type(data) is bytes and data == b"abc" * 400
+        for block_id in dsk.get_file_blocks(ufd): dsk.disk_bytes[block_id*512:block_id*512+3] = b"xyz"
+        assert data == b"abc" * 400
+
+def test_lookup():
+    dsk = Disk.new("4048")
+    sub = add(dsk, 6, "SUB.DR", "YD", None)
+    for i in range(100): add(dsk, 6 if i % 2 else sub, f"F{i}.SV", "", bytes([i]) * i)
+    add(dsk, sub, "NOEXT", "", b"x")
+    for i in range(100):
+        ufd = dsk.lookup(f"F{i}.SV" if i % 2 else f"SUB.DR:F{i}.SV")
+        assert ufd is not None and dsk.get_file_bytes(ufd) == bytes([i]) * i
+    assert dsk.lookup("sub.dr/noext") is not None and dsk.lookup("SUB.DR/NOEXT.") is not None
+    assert dsk.lookup("F0.SV") is None and dsk.lookup("F1.SV/X") is None
+    assert dsk.check() == []
+
+def test_duplicate_name_allocates_nothing():
+    dsk = Disk.new("4048")
+    add(dsk, 6, "A.DA", "D", b"a" * 300000)
+    sub = add(dsk, 6, "SUB.DR", "YD", None)
+    block_map = dsk.get_block_map().copy()
+    disk_bytes = bytes(dsk.disk_bytes)
+    for name, attributes, data in [("A.DA", "D", b"b" * 300000), ("A.DA", "", b"b" * 5000), ("A.DA", "C", b"b" * 5000), ("A.DA", "", b""), ("SUB.DR", "YD", None)]:
+        with pytest.raises(Exception, match="already exists"): add(dsk, 6, name, attributes, data)
+    assert (dsk.get_block_map() == block_map).all()
+    assert bytes(dsk.disk_bytes) == disk_bytes
+    assert dsk.check() == []
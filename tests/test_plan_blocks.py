@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from pydgf.disk import Disk, plan_blocks, get_data_block_count
+from pydgf.ufd import UFD
+
+def make_tree(seed, count, max_size):
+    # (path, ufd, data) with directories before what's in them, like cli.walk_image
+    rng = random.Random(seed)
+    directories = [""]
+    entries = []
+    for i in range(count):
+        parent = rng.choice(directories)
+        ufd = UFD.new()
+        if rng.random() < 0.1:
+            ufd.set_safe_filename(f"D{i}.DR")
+            ufd.set_file_attributes("YD")
+            data = None
+        else:
+            ufd.set_safe_filename(f"F{i}.{rng.choice(['SV', 'DA', ''])}")
+            ufd.set_file_attributes(rng.choice(["", "C", "D"]))
+            data = rng.randbytes(rng.choice([0, 1, 509, 510, 511, 512, 513, rng.randrange(max_size)]))
+            ufd.set_total_byte_count(len(data), ufd.get_file_attributes())
+        path = f"{parent}/{ufd.get_safe_filename()}".lstrip("/")
+        if data is None: directories.append(path)
+        entries.append((path, ufd, data))
+    return entries
+
+def build(entries, dsk_type, frame_size):
+    dsk = Disk.new(dsk_type, frame_size)
+    directories = {"": 6}
+    for path, ufd, data in entries:
+        address = dsk.add_file(directories[path.rpartition("/")[0]], ufd.copy(), data)
+        if ufd.is_dir(): directories[path] = address
+    return dsk
+
+@pytest.mark.parametrize("dsk_type, count, max_size", [("6030", 40, 4000), ("4048", 300, 40000)])
+@pytest.mark.parametrize("frame_size", [1, 5, 11])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_plan_blocks(dsk_type, count, max_size, frame_size, seed):
+    entries = make_tree(seed, count, max_size)
+    planned = plan_blocks([(path, ufd, len(data) if data is not None else 0) for path, ufd, data in entries], dsk_type, frame_size)
+    assert planned <= get_data_block_count(dsk_type)
+    dsk = build(entries, dsk_type, frame_size)
+    # Blocks in use from 16 on (where plan_blocks starts counting)
+    assert int(dsk.get_block_map()[16:dsk.get_word(3, 5)].sum()) == planned
+    assert dsk.check() == []
+
+def test_plan_blocks_big_directory():
+    # One directory with more names than a frame holds
+    ufd = UFD.new()
+    ufd.set_safe_filename("BIG.DR")
+    ufd.set_file_attributes("YD")
+    entries = [("BIG.DR", ufd, None)]
+    for i in range(1000):
+        ufd = UFD.new()
+        ufd.set_safe_filename(f"N{i}")
+        entries.append((f"BIG.DR/N{i}.", ufd, b""))
+    planned = plan_blocks([(path, ufd, 0) for path, ufd, data in entries], "4048", 5)
+    dsk = build(entries, "4048", 5)
+    assert int(dsk.get_block_map()[16:dsk.get_word(3, 5)].sum()) == planned
+    assert dsk.check() == []
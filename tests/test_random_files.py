@@ -0,0 +1,68 @@
+import io
+import random
+
+import pytest
+
+from pydgf.disk import Disk
+from pydgf.ufd import UFD
+
+# Random files keep 255 block addresses per index block, the sizes are around where a second/third index block is needed
+SIZES = {
+    "few blocks": 3*512 + 100,
+    "255 blocks": 255*512,
+    "256 blocks": 256*512,
+    "510 blocks": 510*512,
+    "510 blocks + 1": 510*512 + 1,
+    "several MB": 5*1024*1024 + 123,
+}
+
+@pytest.fixture(scope="module")
+def disk():
+    # Write every file to a 4048 and read it back from a fresh Disk of the image bytes
+    dsk = Disk.new("4048")
+    rng = random.Random(8)
+    files = {}
+    for i, (name, size) in enumerate(SIZES.items()):
+        data = rng.randbytes(size)
+        ufd = UFD.new()
+        ufd.set_safe_filename(f"R{i}.DA")
+        ufd.set_file_attributes("D")
+        ufd.set_total_byte_count(size, ufd.get_file_attributes())
+        dsk.add_file(6, ufd, data)
+        files[name] = (f"R{i}.DA", data)
+    return Disk(dsk.disk_bytes.tobytes()), files
+
+@pytest.mark.parametrize("name", SIZES)
+def test_get_file_bytes(disk, name):
+    dsk, files = disk
+    filename, data = files[name]
+    ufd = dsk.lookup(filename)
+    assert ufd.is_random()
+    assert dsk.get_file_bytes(ufd) == data
+    # An index block per 255 data blocks
+    assert len(dsk.get_random_index_blocks(ufd.get_address(), ufd.get_logical_block_count() + 1)) == (len(data) + 255*512 - 1) // (255*512)
+
+@pytest.mark.parametrize("name", SIZES)
+def test_open(disk, name):
+    dsk, files = disk
+    filename, data = files[name]
+    file = dsk.open(dsk.lookup(filename))
+    assert file.read() == data
+    # Seek to either side of block and index block boundaries
+    for offset in [0, 511, 512, 255*512 - 1, 255*512, 256*512 + 3, len(data) // 2, len(data) - 1]:
+        if offset >= len(data): continue
+        assert file.seek(offset) == offset
+        assert file.read(700) == data[offset:offset + 700]
+    assert file.seek(-10, io.SEEK_END) == len(data) - 10
+    assert file.read() == data[-10:]
+    file.seek(100)
+    assert file.seek(1000, io.SEEK_CUR) == 1100
+    assert file.read(1) == data[1100:1101]
+    assert file.read(0) == b""
+    file.seek(len(data))
+    assert file.read(10) == b""
+
+def test_check(disk):
+    # MAP.DR and the directory agree with the blocks the files use
+    dsk, files = disk
+    assert dsk.check() == []